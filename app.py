@@ -1,48 +1,179 @@
+import threading
+import pandas as pd
 import streamlit as st
-from main import generate_vis
-import os
-import shutil
+from batch import BatchEngine, Job
+from client import get_client
+from tickers import get_index
+from visualisation import get_nlp
 
 """
-This Streamlit application serves as an SEC 10-K AI Analyser. It allows users to enter a ticker symbol 
-of a company, and then displays an image that represents the analysis output of the SEC 10-K filings 
-for that company. The application aims to provide a user-friendly interface for financial analysts 
+This Streamlit application serves as an SEC 10-K AI Analyser. It allows users to enter a ticker symbol
+of a company, and then displays an image that represents the analysis output of the SEC 10-K filings
+for that company. The application aims to provide a user-friendly interface for financial analysts
 and investors interested in understanding corporate fundamentals through automated analysis.
+
+Analyses run as background jobs on a batch engine shared by all sessions, so the script thread only
+polls their progress: a rerun or a second user picks up the running job instead of starting over, and
+finished results are cached per (ticker, start year, end year).
 """
 
+# Companies offered below the search box.
+SUGGESTIONS = 10
+# Entities shown in the bar chart and the trend tables, and entities plotted over time.
+TOP_ENTITIES = 20
+TREND_ENTITIES = 10
+PLOTTED_ENTITIES = 5
+# Seconds between progress updates while a job runs.
+POLL_INTERVAL = 0.5
+# Finished jobs kept for load_result, which caches as many results.
+MAX_FINISHED_JOBS = 100
+STAGE_LABELS = {
+    "download": "Downloading filings",
+    "clean": "Cleaning filings",
+    "ner": "Extracting entities",
+    "llm": "Asking the language model",
+    "render": "Rendering the word cloud",
+}
+
+
+class ResultPending(Exception):
+    """Raised by load_result while no finished job exists for a key, so nothing is cached."""
+
+
+@st.cache_resource
+def load_models():
+    """
+    Load the spaCy pipeline and the LLM client once per server process, so warm sessions reuse them.
+    """
+    return get_nlp(), get_client()
+
+@st.cache_resource
+def load_ticker_index():
+    """Load the ticker index once per server process for the search box."""
+    return get_index()
+
+@st.cache_resource
+def get_engine():
+    """
+    Start the batch engine that runs analyses in the background, shared by every session.
+
+    Returns:
+        tuple: The engine, the dict of jobs by (ticker, start year, end year) and the lock guarding it.
+    """
+    load_models()
+    return BatchEngine(work_dir="app-work"), {}, threading.Lock()
+
+def submit(key):
+    """
+    Return the running or finished job for a key, submitting a new one if there is none or it failed. The
+    oldest finished jobs are dropped beyond MAX_FINISHED_JOBS.
+    """
+    engine, jobs, lock = get_engine()
+    with lock:
+        job = jobs.get(key)
+        if job is None or job.status == "failed":
+            job = jobs[key] = engine.submit(Job(*key))
+        finished = [other for other in jobs if jobs[other].status == "done"]
+        for other in finished[:-MAX_FINISHED_JOBS]:
+            del jobs[other]
+        return job
+
+@st.cache_data(show_spinner=False, max_entries=100)
+def load_result(ticker, start_year, end_year):
+    """
+    Return the text analysis, PNG bytes and per-year entity series of a finished analysis.
+
+    Revisiting the same ticker and years renders straight from the cache. The job is left in place, so
+    sessions loading the same result at the same time all find it; submit drops old finished jobs.
+
+    Raises:
+        ResultPending: If there is no finished job for the key yet.
+    """
+    engine, jobs, lock = get_engine()
+    key = (ticker, start_year, end_year)
+    with lock:
+        job = jobs.get(key)
+        if job is None or job.status != "done":
+            raise ResultPending(key)
+    engine.store.evict()
+    return job.text_response, job.image.getvalue(), job.series
+
+def show_trends(series):
+    """Explore the entity counts of any window of the analysed years, and the entities rising and fading in it."""
+    years = series.years
+    if len(years) < 2:
+        return
+    st.subheader("Entities over time")
+    start, end = st.slider("Years to explore", years[0], years[-1], (years[0], years[-1]), key="explore_years")
+
+    counts = series.counts(start, end, top=TOP_ENTITIES)
+    st.bar_chart(pd.DataFrame({"mentions": counts}))
+
+    rising, fading = series.trends(start, end, top=TREND_ENTITIES)
+    rising_column, fading_column = st.columns(2)
+    rising_column.write("Rising")
+    rising_column.table(pd.DataFrame(rising, columns=["entity", "share change per year"]))
+    fading_column.write("Fading")
+    fading_column.table(pd.DataFrame(fading, columns=["entity", "share change per year"]))
+
+    plotted = list(counts)[:PLOTTED_ENTITIES]
+    st.line_chart(pd.DataFrame(series.yearly(plotted, start, end), index=range(start, end + 1)))
+
+def show_progress(job):
+    """Poll a running job, updating a progress bar until it finishes."""
+    progress_bar = st.progress(0.0)
+    status = st.empty()
+    while not job.finished.wait(POLL_INTERVAL):
+        label = STAGE_LABELS.get(job.stage, "Queued")
+        if job.total:
+            label += f" ({job.done}/{job.total})"
+        progress_bar.progress(job.progress)
+        status.text(f"Analyzing {job.ticker}... {label}")
+    progress_bar.progress(1.0)
+    status.empty()
+
 # Set the title of the webpage
 st.title('SEC 10-K AI Analyser')
 
-# Input for ticker symbol
-user_input_value = st.text_input("Enter TICKER SYMBOL:", help="Type the ticker symbol of the company and press Enter.")
+# Input for ticker symbol; matching companies are suggested for a ticker or company name
+query = st.text_input("Enter TICKER SYMBOL:", help="Type the ticker symbol or the name of the company and press Enter.")
+user_input_value = None
+if query:
+    matches = load_ticker_index().search(query, limit=SUGGESTIONS)
+    if matches:
+        company = st.selectbox("Company", matches, format_func=lambda match: f"{match['ticker']} - {match['title']}")
+        user_input_value = company["ticker"]
+    else:
+        st.warning(f"No company matches {query!r}.")
 
 # Add a slider for selecting year
 start_year, end_year = st.slider("Select Year", 1995, 2023, (1995, 2023))
 
 
-# Button to trigger the analysis
-if st.button("Generate Analysis", key="generate_button",use_container_width=True):
-    st.write("Analyzing...")
-    progress_bar = st.progress(0)
-    
-    # Execute the generate_vis function
-    text_response = generate_vis(user_input_value, start_year, end_year)
-    
-    # Update the placeholder with the final image upon completion
-    st.image("vis.png", caption="Analysis complete!")
+# Button to trigger the analysis; the active analysis is remembered across reruns.
+if st.button("Generate Analysis", key="generate_button",use_container_width=True) and user_input_value:
+    st.session_state.active = (user_input_value.strip().upper(), start_year, end_year)
+
+# The Done button clears the analysis on the rerun it triggers.
+if st.session_state.get("done_button"):
+    st.session_state.active = None
+
+if st.session_state.get("active"):
+    key = st.session_state.active
+    try:
+        text_response, image, series = load_result(*key)
+    except ResultPending:
+        job = submit(key)
+        show_progress(job)
+        if job.status == "failed":
+            st.error(f"Analysis of {job.ticker} failed: {job.error}")
+            st.session_state.active = None
+            st.stop()
+        text_response, image, series = load_result(*key)
+
+    # Show the final image upon completion
+    st.image(image, caption="Analysis complete!")
     st.text(text_response)
-    
-    st.button("Done", key="done_button",use_container_width=True)
+    show_trends(series)
 
-# Check if the Done button is pressed after analysis
-if 'done_button' in st.session_state and st.session_state.done_button:
-    # Remove the data-META folder and vis.png file
-    if os.path.exists(f"data-{user_input_value}"):
-        shutil.rmtree(f"data-{user_input_value}")
-    if os.path.exists("vis.png"):
-        os.remove("vis.png")
-    st.success("Cleanup successful!")
-    st.session_state.done_button = False  # Reset the button state
-
-    if st.button("Done", key="Done",use_container_width=True):
-        print("Application done")
\ No newline at end of file
+    st.button("Done", key="done_button",use_container_width=True)
@@ -0,0 +1,320 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import itertools
+import threading
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+
+from client import analyse
+from instrumentation import export
+from downloader import (clean_filings, company_lock, data_dir, export_filings, fetch_filings,
+                        get_cik_number_from_file, get_scheduler, get_store)
+from visualisation import entity_payload, load_series, render_vis
+
+"""
+Batch analysis of many tickers. Each job is one (ticker, year range) and passes through the stages
+download -> clean -> ner -> llm -> render. Every stage has its own worker pool, so while one job waits on
+the LLM the next is already in NER and a third is downloading. Jobs get an isolated working directory
+for their downloads and data folder, and share the filing store, the entity cache, the LLM client and
+one rate-limited EDGAR scheduler.
+
+Usage:
+    python batch.py AAPL MSFT META --start 2015 --end 2023 --output batch-results
+    python batch.py --file watchlist.txt --output batch-results
+
+Besides the word clouds and analyses, the output directory receives summary.json with each job's status
+and stage timings, and metrics.json with the totals of every instrumented stage.
+"""
+
+STAGES = ("download", "clean", "ner", "llm", "render")
+# Workers per stage. Downloads share one rate-limited scheduler, cleaning and NER fan out to process
+# pools of their own, and LLM requests mostly wait on the network.
+STAGE_CONCURRENCY = {"download": 4, "clean": 1, "ner": 1, "llm": 4, "render": 2}
+WORK_DIR = "batch-work"
+
+
+@dataclass
+class Job:
+    """One ticker and year range to analyse, with its progress and results."""
+
+    ticker: str
+    start_year: int = 1995
+    end_year: int = 2023
+    # queued, running, done or failed.
+    status: str = "queued"
+    stage: str = None
+    # Progress within the current stage, e.g. years downloaded or filings run through NER.
+    done: int = 0
+    total: int = 0
+    error: str = None
+    workdir: str = None
+    timings: dict = field(default_factory=dict)
+    text_response: str = None
+    image: object = field(default=None, repr=False)
+    image_path: str = None
+    # Entity counts per year of the job's filings, for trend views and other year windows.
+    series: object = field(default=None, repr=False)
+    # Intermediate results handed from one stage to the next; dropped once the job finishes.
+    cik: str = field(default=None, repr=False)
+    accessions: dict = field(default=None, repr=False)
+    checked_years: list = field(default=None, repr=False)
+    per_filing: list = field(default=None, repr=False)
+    all_entities: dict = field(default=None, repr=False)
+    response: str = field(default=None, repr=False)
+    finished: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    @property
+    def name(self):
+        return f"{self.ticker}-{self.start_year}-{self.end_year}"
+
+    @property
+    def progress(self):
+        """Overall progress between 0 and 1, counting each stage equally."""
+        if self.status in ("done", "failed"):
+            return 1.0
+        if self.stage is None:
+            return 0.0
+        within = self.done / self.total if self.total else 0.0
+        return (STAGES.index(self.stage) + within) / len(STAGES)
+
+    def summary(self):
+        return {
+            "ticker": self.ticker,
+            "start_year": self.start_year,
+            "end_year": self.end_year,
+            "status": self.status,
+            "error": self.error,
+            "timings": self.timings,
+            "image_path": self.image_path,
+        }
+
+
+class BatchEngine:
+    """
+    Runs jobs through the pipelined stages. ``run`` processes a list of jobs and waits for them; a
+    long-lived engine (such as the web app's) can instead ``submit`` jobs one at a time and follow their
+    progress. Call ``close`` to stop the stage workers.
+
+    Args:
+        work_dir (str): Parent directory of the per-job working directories.
+        output_dir (str): If given, each finished job's word cloud and analysis are written here as
+            ``{ticker}-{start}-{end}.png`` and ``.txt`` instead of being kept in memory.
+        store (FilingStore): The filing store shared by all jobs; defaults to downloader.get_store().
+        scheduler (DownloadScheduler): The EDGAR scheduler shared by all jobs, so its rate limit is global;
+            defaults to downloader.get_scheduler().
+        concurrency (dict): Workers per stage, overriding STAGE_CONCURRENCY.
+        on_progress (callable): Called with the job whenever it enters a stage, makes progress within one,
+            finishes or fails.
+        keep_workdirs (bool): Keep the working directories of finished jobs.
+    """
+
+    def __init__(self, work_dir=WORK_DIR, output_dir=None, store=None, scheduler=None, concurrency=None,
+                 on_progress=None, keep_workdirs=False):
+        self.work_dir = work_dir
+        self.output_dir = output_dir
+        self.store = store or get_store()
+        self.scheduler = scheduler or get_scheduler()
+        self.concurrency = {**STAGE_CONCURRENCY, **(concurrency or {})}
+        self.on_progress = on_progress
+        self.keep_workdirs = keep_workdirs
+        self._job_numbers = itertools.count()
+        self._executors = {
+            stage: ThreadPoolExecutor(max_workers=self.concurrency[stage], thread_name_prefix=f"batch-{stage}")
+            for stage in STAGES
+        }
+
+    def _download(self, job):
+        job.cik = get_cik_number_from_file(job.ticker) or job.ticker
+        # The company lock is taken when a job starts downloading and released when it has finished cleaning.
+        lock = company_lock(job.cik)
+        lock.acquire()
+        try:
+            job.cik, job.accessions, job.checked_years = fetch_filings(
+                job.ticker, job.start_year, job.end_year, self.store, job.workdir, self.scheduler,
+                on_progress=self._reporter(job),
+            )
+        except BaseException:
+            lock.release()
+            raise
+
+    def _clean(self, job):
+        try:
+            if job.accessions or job.checked_years:
+                clean_filings(job.cik, job.ticker, job.accessions, job.checked_years, self.store,
+                              on_progress=self._reporter(job))
+            entries = export_filings(job.cik, job.ticker, job.start_year, job.end_year, self.store, job.workdir)
+        finally:
+            company_lock(job.cik).release()
+        if not entries:
+            raise ValueError(f"no 10-K filings found for {job.ticker} in {job.start_year}-{job.end_year}")
+
+    def _ner(self, job):
+        job.series = load_series(data_dir(job.ticker, job.workdir), on_progress=self._reporter(job))
+        job.per_filing = job.series.per_year(job.start_year, job.end_year)
+        job.all_entities = job.series.counts(job.start_year, job.end_year)
+
+    def _llm(self, job):
+        job.response, job.text_response = analyse(entity_payload(job.per_filing), on_progress=self._reporter(job))
+
+    def _render(self, job):
+        image = render_vis(job.response, job.all_entities)
+        if self.output_dir is None:
+            job.image = image
+            return
+        job.image_path = os.path.join(self.output_dir, f"{job.name}.png")
+        with open(job.image_path, 'wb') as file:
+            file.write(image.getvalue())
+        with open(os.path.join(self.output_dir, f"{job.name}.txt"), 'w', encoding='utf-8') as file:
+            file.write(job.text_response or "")
+
+    def _notify(self, job):
+        if self.on_progress is not None:
+            self.on_progress(job)
+
+    def _reporter(self, job):
+        def report(done, total):
+            job.done, job.total = done, total
+            self._notify(job)
+        return report
+
+    def _finish(self, job):
+        job.accessions = job.checked_years = job.per_filing = job.all_entities = job.response = None
+        if not self.keep_workdirs:
+            shutil.rmtree(job.workdir, ignore_errors=True)
+        self._notify(job)
+        job.finished.set()
+
+    def _run_stage(self, job, position):
+        stage = STAGES[position]
+        job.stage, job.status, job.done, job.total = stage, "running", 0, 0
+        self._notify(job)
+        start = time.perf_counter()
+        try:
+            getattr(self, f"_{stage}")(job)
+        except Exception as e:
+            job.timings[stage] = round(time.perf_counter() - start, 3)
+            job.status, job.error = "failed", f"{stage}: {e}"
+            self._finish(job)
+            return
+        job.timings[stage] = round(time.perf_counter() - start, 3)
+        if position + 1 < len(STAGES):
+            self._executors[STAGES[position + 1]].submit(self._run_stage, job, position + 1)
+        else:
+            job.status = "done"
+            self._finish(job)
+
+    def submit(self, job):
+        """
+        Queue a job without waiting for it; ``job.finished`` is set once it is done or has failed.
+
+        Args:
+            job (Job or tuple): A Job, or a ``(ticker, start_year, end_year)`` tuple.
+
+        Returns:
+            Job: The queued job.
+        """
+        job = job if isinstance(job, Job) else Job(*job)
+        if self.output_dir:
+            os.makedirs(self.output_dir, exist_ok=True)
+        job.workdir = os.path.join(self.work_dir, f"{next(self._job_numbers):04d}-{job.name}")
+        os.makedirs(job.workdir, exist_ok=True)
+        self._executors[STAGES[0]].submit(self._run_stage, job, 0)
+        return job
+
+    def run(self, jobs):
+        """
+        Run jobs to completion, then enforce the filing store's size and age bounds.
+
+        Args:
+            jobs (list): Job objects, or ``(ticker, start_year, end_year)`` tuples.
+
+        Returns:
+            list: The Job objects, in input order, each done or failed.
+        """
+        jobs = [self.submit(job) for job in jobs]
+        for job in jobs:
+            job.finished.wait()
+        self.store.evict()
+        return jobs
+
+    def close(self):
+        """Stop the stage workers once the queued jobs have finished."""
+        for executor in self._executors.values():
+            executor.shutdown(wait=True)
+
+
+def read_watchlist(path, start_year, end_year):
+    """
+    Read jobs from a file with one ``TICKER`` or ``TICKER START END`` per line; blank lines and lines
+    starting with # are skipped.
+    """
+    jobs = []
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            fields = line.split("#", 1)[0].split()
+            if not fields:
+                continue
+            if len(fields) == 3:
+                jobs.append(Job(fields[0].upper(), int(fields[1]), int(fields[2])))
+            else:
+                jobs.append(Job(fields[0].upper(), start_year, end_year))
+    return jobs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyse the 10-K filings of many tickers.")
+    parser.add_argument("tickers", nargs="*", help="ticker symbols to analyse")
+    parser.add_argument("--file", help="watchlist with one TICKER or TICKER START END per line")
+    parser.add_argument("--start", type=int, default=1995)
+    parser.add_argument("--end", type=int, default=2023)
+    parser.add_argument("--output", default="batch-results", help="directory for the word clouds, analyses and summary")
+    parser.add_argument("--work-dir", default=WORK_DIR)
+    parser.add_argument("--keep-workdirs", action="store_true")
+    for stage in STAGES:
+        parser.add_argument(f"--{stage}-workers", type=int, default=STAGE_CONCURRENCY[stage])
+    args = parser.parse_args(argv)
+
+    jobs = [Job(ticker.upper(), args.start, args.end) for ticker in args.tickers]
+    if args.file:
+        jobs += read_watchlist(args.file, args.start, args.end)
+    if not jobs:
+        parser.error("no tickers given")
+
+    finished = [0]
+    progress_lock = threading.Lock()
+
+    def on_progress(job):
+        with progress_lock:
+            if job.status in ("done", "failed"):
+                finished[0] += 1
+                detail = job.error if job.status == "failed" else f"{sum(job.timings.values()):.1f}s"
+                print(f"[{finished[0]}/{len(jobs)}] {job.name}: {job.status} ({detail})")
+            elif job.total == 0:
+                print(f"{job.name}: {job.stage}")
+
+    engine = BatchEngine(
+        work_dir=args.work_dir,
+        output_dir=args.output,
+        concurrency={stage: getattr(args, f"{stage}_workers") for stage in STAGES},
+        on_progress=on_progress,
+        keep_workdirs=args.keep_workdirs,
+    )
+    try:
+        jobs = engine.run(jobs)
+    finally:
+        engine.close()
+
+    with open(os.path.join(args.output, "summary.json"), 'w', encoding='utf-8') as file:
+        json.dump([job.summary() for job in jobs], file, indent=1)
+    export(os.path.join(args.output, "metrics.json"))
+    failed = [job for job in jobs if job.status == "failed"]
+    print(f"{len(jobs) - len(failed)} done, {len(failed)} failed; results in {args.output}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,650 @@
+import os
+import sys
+import time
+import json
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from instrumentation import peak_rss_mb
+
+"""
+Offline benchmarks for the SEC 10-K AI Analyser pipeline. Every benchmark runs against a synthetic,
+deterministic 10-K corpus generated on the fly, so results are reproducible without network access.
+
+Usage:
+    python benchmark.py html --filings 29 --paragraphs 4000
+    python benchmark.py ner --filings 29 --processes 1 4
+    python benchmark.py imports --repeat 5
+    python benchmark.py embed --chunks 5000 --latency 0.05
+    python benchmark.py retrieval --backends hashing tfidf --k 5
+    python benchmark.py hybrid --backend hashing --k 5
+    python benchmark.py tickers --lookups 1000
+    python benchmark.py pipeline --tickers 3 --start 2015 --end 2022 --output pipeline-metrics.json
+"""
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+RAG_DIR = os.path.join(ROOT_DIR, "rag-model")
+
+WORDS = (
+    "revenue operating income net sales fiscal year risk factors competition regulation customers "
+    "products services market growth liquidity capital resources cash flows segment international "
+    "advertising platform users research development intellectual property litigation tax "
+    "acquisition subsidiaries employees supply chain manufacturing data privacy security"
+).split()
+NAMES = ["Mark Zuckerberg", "Sheryl Sandberg", "Tim Cook", "Satya Nadella", "Jensen Huang", "Lisa Su"]
+PRODUCTS = ["Instagram", "WhatsApp", "Oculus Quest", "iPhone", "Azure", "Windows", "GeForce"]
+LAWS = ["the Sarbanes-Oxley Act", "the Dodd-Frank Act", "the General Data Protection Regulation",
+        "the Tax Cuts and Jobs Act", "the Securities Exchange Act of 1934"]
+SECTIONS = [("1", "Business"), ("1A", "Risk Factors"), ("2", "Properties"), ("3", "Legal Proceedings"),
+            ("7", "Management's Discussion and Analysis of Financial Condition and Results of Operations"),
+            ("8", "Financial Statements and Supplementary Data")]
+FACT_TOPICS = ["payments", "augmented reality", "semiconductor", "cloud storage", "advertising analytics",
+               "speech recognition", "cybersecurity", "satellite imaging", "battery", "logistics"]
+CITIES = ["Lulea", "Odense", "Prineville", "Altoona", "Clonee", "Papillion", "Eagle Mountain", "Henrico"]
+SYLLABLES = ["zor", "vex", "qua", "lin", "tra", "mo", "nex", "dri", "ka", "pel", "sy", "ron"]
+FACT_TEMPLATES = [
+    ("Item 7", "In {year} we completed the acquisition of {name}, a developer of {topic} software, for ${amount} million in cash.",
+     "Which developer of {topic} software did the company acquire in {year}?"),
+    ("Item 3", "In {year}, {name} filed a patent infringement lawsuit against us relating to our {topic} products.",
+     "Who sued the company for patent infringement over its {topic} products in {year}?"),
+    ("Item 2", "During {year} we opened a new {topic} data center in {city} operated with {name}.",
+     "Where did the company open a {topic} data center in {year}?"),
+]
+
+
+def synthetic_paragraph(rng, words=60):
+    """Build one paragraph of filing-like prose sprinkled with people, products and laws."""
+    tokens = [rng.choice(WORDS) for _ in range(words)]
+    for pool in (NAMES, PRODUCTS, LAWS):
+        tokens.insert(rng.randrange(len(tokens)), rng.choice(pool))
+    text = " ".join(tokens)
+    # Only the first letter: str.capitalize would lower-case the planted names.
+    return text[:1].upper() + text[1:] + "."
+
+
+def synthetic_10k_html(seed, paragraphs=2000):
+    """
+    Generate a deterministic HTML document shaped like an EDGAR 10-K primary document.
+
+    Args:
+        seed (int): Seed for the random generator; the same seed always yields the same document.
+        paragraphs (int): Number of body paragraphs, spread evenly over the standard Items.
+
+    Returns:
+        str: The HTML document.
+    """
+    rng = random.Random(seed)
+    parts = ["<html><head><title>10-K</title><style>p {margin: 0}</style>",
+             "<script>var tracking = 'not document text';</script></head><body>"]
+    per_section = max(1, paragraphs // len(SECTIONS))
+    for number, title in SECTIONS:
+        parts.append(f'<div><span style="font-weight:bold">Item {number}. {title}</span></div>')
+        for index in range(per_section):
+            parts.append(f'<div><p style="font-size:10pt">{synthetic_paragraph(rng)}</p></div>')
+            if index % 50 == 0:
+                cells = "".join(f"<td>{rng.randint(1, 99999):,}</td>" for _ in range(6))
+                parts.append(f"<table><tr><td>Total&nbsp;revenue</td>{cells}</tr></table>")
+    parts.append("</body></html>")
+    return "\n".join(parts)
+
+
+def synthetic_10k_text(seed, paragraphs=2000):
+    """Generate the cleaned text of a synthetic filing: Item headings and paragraphs separated by blank lines."""
+    rng = random.Random(seed)
+    parts = []
+    per_section = max(1, paragraphs // len(SECTIONS))
+    for number, title in SECTIONS:
+        parts.append(f"Item {number}. {title}")
+        parts.extend(synthetic_paragraph(rng) for _ in range(per_section))
+    return "\n\n".join(parts)
+
+
+def synthetic_qa_corpus(filings=29, paragraphs=120, first_year=1995, ticker="SYN"):
+    """
+    Build a labelled retrieval fixture: chunks of synthetic filings with one planted fact per filing,
+    and a question per fact whose answer is in exactly that chunk.
+
+    Returns:
+        tuple: ``chunks``, a list of ``(text, metadata)`` with ticker, year and section metadata, and
+        ``questions``, a list of ``(question, chunk_index, metadata)``.
+    """
+    rng = random.Random(7)
+    chunks, questions = [], []
+    for index in range(filings):
+        year = first_year + index
+        for number, _ in SECTIONS:
+            for _ in range(max(1, paragraphs // len(SECTIONS))):
+                chunks.append((synthetic_paragraph(rng), {"ticker": ticker, "year": year, "section": f"Item {number}"}))
+        section, fact, question = FACT_TEMPLATES[index % len(FACT_TEMPLATES)]
+        values = {
+            "year": year,
+            "name": "".join(rng.choice(SYLLABLES) for _ in range(3)).capitalize() + " Inc.",
+            "topic": rng.choice(FACT_TOPICS),
+            "city": rng.choice(CITIES),
+            "amount": rng.randint(10, 900),
+        }
+        metadata = {"ticker": ticker, "year": year, "section": section}
+        questions.append((question.format(**values), len(chunks), metadata))
+        chunks.append((fact.format(**values) + " " + synthetic_paragraph(rng), metadata))
+    return chunks, questions
+
+
+def write_html_corpus(directory, filings=29, paragraphs=2000, first_year=1995):
+    """
+    Write a corpus of synthetic filings laid out like ``sec-edgar-filings/{ticker}/10-K/``.
+
+    Returns:
+        list: Paths of the written primary documents, one per year.
+    """
+    paths = []
+    for index in range(filings):
+        year = first_year + index
+        accession = f"0000000001-{year % 100:02d}-{index:06d}"
+        os.makedirs(os.path.join(directory, accession), exist_ok=True)
+        path = os.path.join(directory, accession, "primary-document.html")
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(synthetic_10k_html(seed=year, paragraphs=paragraphs))
+        paths.append(path)
+    return paths
+
+
+def report(name, seconds, items, nbytes=None, unit="files"):
+    line = f"{name:<32} {seconds:8.3f}s  {items / seconds:8.2f} {unit}/s"
+    if nbytes is not None:
+        line += f"  {nbytes / seconds / 1024 ** 2:8.2f} MB/s"
+    print(line)
+
+
+def bench_html(args):
+    """Compare HTML-to-text throughput of the conversion backends against the original BeautifulSoup path."""
+    from downloader import HTML_BACKENDS, cleaned_file_path, convert_filings, remove_html_tags
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_html_corpus(directory, filings=args.filings, paragraphs=args.paragraphs)
+        nbytes = sum(os.path.getsize(path) for path in paths)
+        print(f"Corpus: {len(paths)} filings, {nbytes / 1024 ** 2:.1f} MB")
+
+        def clear_outputs():
+            for path in paths:
+                if os.path.exists(cleaned_file_path(path)):
+                    os.remove(cleaned_file_path(path))
+
+        for backend in ("bs4",) + tuple(b for b in HTML_BACKENDS if b != "bs4"):
+            clear_outputs()
+            start = time.perf_counter()
+            for path in paths:
+                remove_html_tags(path, backend=backend)
+            report(f"serial {backend}", time.perf_counter() - start, len(paths), nbytes)
+
+        clear_outputs()
+        start = time.perf_counter()
+        convert_filings(paths, backend="lxml", max_workers=args.workers)
+        report("process pool lxml", time.perf_counter() - start, len(paths), nbytes)
+
+        # A second pass finds every cleaned output newer than its source and does no work.
+        start = time.perf_counter()
+        convert_filings(paths, backend="lxml", max_workers=args.workers)
+        report("process pool lxml (up to date)", time.perf_counter() - start, len(paths), nbytes)
+
+
+def bench_ner(args):
+    """
+    Measure NER docs/sec and peak RSS: whole documents in one process (the original behaviour) against
+    paragraph-chunked streaming on one and several processes. Each configuration runs in a fresh
+    interpreter so peak RSS figures do not bleed into each other.
+    """
+    if args.single:
+        import visualisation
+
+        texts = (synthetic_10k_text(seed=1995 + index, paragraphs=args.paragraphs) for index in range(args.filings))
+        max_chars = args.chunk_chars or sys.maxsize
+        nlp = visualisation.get_nlp()
+        nlp.max_length = max(nlp.max_length, args.paragraphs * 1000)
+        start = time.perf_counter()
+        entities = visualisation.extract_entities(texts, n_process=args.processes[0], max_chars=max_chars)
+        seconds = time.perf_counter() - start
+        rss_self, rss_children = peak_rss_mb()
+        print(json.dumps({"seconds": seconds, "entities": len(entities),
+                          "rss_self_mb": rss_self, "rss_children_mb": rss_children}))
+        return
+
+    print(f"Corpus: {args.filings} synthetic filings x {args.paragraphs} paragraphs")
+    configs = [("whole documents, 1 process", 0, 1)]
+    configs += [(f"{args.chunk_chars}-char chunks, {n} process(es)", args.chunk_chars, n) for n in args.processes]
+    for name, chunk_chars, processes in configs:
+        command = [sys.executable, __file__, "ner", "--single", "--filings", str(args.filings),
+                   "--paragraphs", str(args.paragraphs), "--chunk-chars", str(chunk_chars),
+                   "--processes", str(processes)]
+        result = json.loads(subprocess.run(command, check=True, capture_output=True, text=True).stdout.splitlines()[-1])
+        report(name, result["seconds"], args.filings, unit="docs")
+        print(f"{'':<32} peak RSS {result['rss_self_mb']:.0f} MB (largest worker {result['rss_children_mb']:.0f} MB),"
+              f" {result['entities']} distinct entities")
+
+
+def bench_imports(args):
+    """
+    Time cold imports of the pipeline modules in fresh interpreters, and separately the cost of the
+    models they now load lazily, to show what an import no longer pays for.
+    """
+    cases = [(f"import {module}", f"import {module}") for module in ("downloader", "client", "visualisation", "main")]
+    cases += [
+        ("first get_nlp()", "import visualisation; visualisation.get_nlp()"),
+        ("first get_client()", "import client; client.get_client()"),
+    ]
+    for name, code in cases:
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, "-c", code], check=True, cwd=ROOT_DIR)
+            timings.append(time.perf_counter() - start)
+        print(f"{name:<32} best {min(timings):8.3f}s  median {sorted(timings)[len(timings) // 2]:8.3f}s")
+
+
+def bench_embed(args):
+    """
+    Embedding throughput with the deterministic local backend, which sleeps to simulate a remote round
+    trip: sequential fixed batches of 10 (the original behaviour) against token-budgeted concurrent batches.
+    """
+    sys.path.insert(0, RAG_DIR)
+    from backends import HashingEmbeddings
+    from embedding_pipeline import embed_texts
+
+    rng = random.Random(0)
+    texts = [" ".join(synthetic_paragraph(rng, words=rng.randint(20, 90)) for _ in range(2)) for _ in range(args.chunks)]
+    backend = HashingEmbeddings(dim=args.dim, latency=args.latency)
+    configs = [("fixed batches of 10, 1 in flight", dict(max_batch_size=10, max_in_flight=1))]
+    configs += [(f"token-budgeted, {n} in flight", dict(max_in_flight=n)) for n in args.in_flight]
+    for name, options in configs:
+        start = time.perf_counter()
+        vectors = embed_texts(texts, backend, verbose=False, **options)
+        report(name, time.perf_counter() - start, len(vectors), unit="chunks")
+
+
+def bench_retrieval(args):
+    """
+    Recall@k and query latency of the embedding backends on the labelled fixture, through the path the RAG
+    model queries: the persistent FAISS vector index alone, and the hybrid retriever on top of it.
+    """
+    sys.path.insert(0, RAG_DIR)
+    from backends import get_backend
+    from embedding_pipeline import embed_texts
+    from hybrid import HybridRetriever
+    from vector_index import VectorIndex
+
+    chunks, questions = synthetic_qa_corpus(filings=args.filings, paragraphs=args.paragraphs)
+    texts = [text for text, _ in chunks]
+    print(f"Fixture: {len(texts)} chunks, {len(questions)} labelled questions, k={args.k}")
+    for name in args.backends:
+        backend = get_backend(name)
+        with tempfile.TemporaryDirectory() as directory:
+            start = time.perf_counter()
+            backend.fit(texts)
+            index = VectorIndex(directory)
+            index.sync(texts, [metadata for _, metadata in chunks], lambda new: embed_texts(new, backend, verbose=False))
+            retriever = HybridRetriever(index, backend, k=args.k)
+            index_seconds = time.perf_counter() - start
+            modes = [
+                ("vector index", lambda question: [retriever.texts[retriever.positions[id_]]
+                                                   for id_, _ in index.search_ids(backend.embed_query(question), args.k)]),
+                ("hybrid", retriever.invoke),
+            ]
+            for mode, run in modes:
+                hits, start = 0, time.perf_counter()
+                for question, expected, _ in questions:
+                    hits += texts[expected] in run(question)
+                seconds = time.perf_counter() - start
+                print(f"{name + ' ' + mode:<32} recall@{args.k} {hits / len(questions):6.3f}  "
+                      f"{seconds / len(questions) * 1000:8.2f} ms/query  (index built in {index_seconds:.2f}s)")
+
+
+def bench_hybrid(args):
+    """
+    Recall@k and query latency of BM25, vector and hybrid retrieval over a persistent vector index, with
+    and without a year filter taken from each question, and with the query cache warm.
+    """
+    sys.path.insert(0, RAG_DIR)
+    from backends import get_backend
+    from embedding_pipeline import embed_texts
+    from hybrid import HybridRetriever
+    from vector_index import VectorIndex
+
+    chunks, questions = synthetic_qa_corpus(filings=args.filings, paragraphs=args.paragraphs)
+    texts = [text for text, _ in chunks]
+    print(f"Fixture: {len(texts)} chunks, {len(questions)} labelled questions, k={args.k}")
+    backend = get_backend(args.backend)
+    backend.fit(texts)
+
+    with tempfile.TemporaryDirectory() as directory:
+        index = VectorIndex(directory)
+        index.sync(texts, [metadata for _, metadata in chunks], lambda new: embed_texts(new, backend, verbose=False))
+        start = time.perf_counter()
+        retriever = HybridRetriever(index, backend, k=args.k)
+        print(f"BM25 index built in {time.perf_counter() - start:.3f}s")
+
+        modes = [
+            ("bm25", lambda question, _: [retriever.texts[position] for position, _ in retriever.bm25.search(question, args.k)]),
+            ("vector", lambda question, _: [retriever.texts[retriever.positions[id_]]
+                                            for id_, _ in index.search_ids(backend.embed_query(question), args.k)]),
+            ("hybrid", lambda question, _: retriever.invoke(question)),
+            ("hybrid, year filter", lambda question, metadata: retriever.invoke(question, where={"year": metadata["year"]})),
+            ("hybrid, year filter, cached", lambda question, metadata: retriever.invoke(question, where={"year": metadata["year"]})),
+        ]
+        for name, run in modes:
+            hits, start = 0, time.perf_counter()
+            for question, expected, metadata in questions:
+                hits += texts[expected] in run(question, metadata)
+            seconds = time.perf_counter() - start
+            print(f"{args.backend + ' ' + name:<40} recall@{args.k} {hits / len(questions):6.3f}  "
+                  f"{seconds / len(questions) * 1000:8.3f} ms/query")
+        print(f"Query cache: {retriever.cache_hits} hits, {retriever.cache_misses} misses")
+
+
+def bench_tickers(args):
+    """
+    Ticker -> CIK lookups with the original per-call JSON load and linear scan against the ticker index,
+    plus index build and load times and search-box queries.
+    """
+    from tickers import TICKERS_PATH, TickerIndex
+
+    def linear_lookup(ticker):
+        with open(TICKERS_PATH, 'r') as file:
+            data = json.load(file)
+        for _, company_info in data.items():
+            if company_info['ticker'] == ticker:
+                return company_info['cik_str']
+        return None
+
+    index = TickerIndex.from_json()
+    rng = random.Random(0)
+    tickers = [rng.choice(index.tickers) for _ in range(args.lookups)]
+
+    start = time.perf_counter()
+    for ticker in tickers[:args.linear_lookups]:
+        linear_lookup(ticker)
+    report("linear scan (JSON per call)", time.perf_counter() - start, min(args.linear_lookups, len(tickers)), unit="lookups")
+
+    with tempfile.TemporaryDirectory() as directory:
+        index_path = os.path.join(directory, "ticker-index.pickle")
+        start = time.perf_counter()
+        TickerIndex.load(index_path=index_path)
+        print(f"{'index build + save':<32} {time.perf_counter() - start:8.3f}s")
+        start = time.perf_counter()
+        index = TickerIndex.load(index_path=index_path)
+        print(f"{'index load (pickle)':<32} {time.perf_counter() - start:8.3f}s")
+
+    start = time.perf_counter()
+    for ticker in tickers:
+        index.cik(ticker.lower())
+    report("index lookup", time.perf_counter() - start, len(tickers), unit="lookups")
+
+    for name, queries in (("prefix search", ["app", "micro", "ban", "meta platforms", "berkshire", "nv"]),
+                          ("fuzzy search", ["microsfot", "alphabt", "nvidea corp", "amazn"])):
+        start = time.perf_counter()
+        for _ in range(args.searches):
+            for query in queries:
+                index.search(query)
+        report(name, time.perf_counter() - start, args.searches * len(queries), unit="queries")
+
+
+def serve(handler_class):
+    """Serve a request handler on a free local port from a daemon thread; returns the server and its URL."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler_class)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Base for the stub servers: JSON or HTML replies, a request counter and no request log."""
+
+    requests = 0
+    lock = threading.Lock()
+
+    def reply(self, status, body, content_type="application/json"):
+        with self.lock:
+            type(self).requests += 1
+        body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def stub_edgar(companies, first_year, last_year, paragraphs):
+    """
+    A stub of data.sec.gov and www.sec.gov: one 10-K per year for each CIK in ``companies``, whose primary
+    document is a synthetic filing seeded by CIK and year.
+    """
+
+    @lru_cache(maxsize=None)
+    def document(cik, year):
+        return synthetic_10k_html(seed=cik * 10000 + year, paragraphs=paragraphs)
+
+    def accession(cik, year):
+        return f"{cik:010d}-{year % 100:02d}-000001"
+
+    class EdgarHandler(StubHandler):
+        requests = 0
+
+        def do_GET(self):
+            parts = self.path.strip("/").split("/")
+            if parts[0] == "submissions" and int(parts[1][3:13]) in companies:
+                cik = int(parts[1][3:13])
+                years = list(range(first_year, last_year + 1))
+                recent = {
+                    "form": ["10-K"] * len(years),
+                    "filingDate": [f"{year}-02-15" for year in years],
+                    "accessionNumber": [accession(cik, year) for year in years],
+                    "primaryDocument": [f"syn-{year}.htm" for year in years],
+                }
+                self.reply(200, json.dumps({"cik": str(cik), "filings": {"recent": recent}}))
+            elif parts[:3] == ["Archives", "edgar", "data"] and int(parts[3]) in companies:
+                year = int(parts[5][4:8])
+                self.reply(200, document(int(parts[3]), year), "text/html")
+            else:
+                self.reply(404, json.dumps({"error": "not found"}))
+
+    return EdgarHandler
+
+
+def stub_llm(latency):
+    """
+    A stub of an OpenAI-compatible chat-completions API. The keywords request is answered with the 40
+    most frequent entities it was sent, the analysis request with a fixed text, each after ``latency`` seconds.
+    """
+    from client import KEYWORDS_PROMPT
+
+    class LLMHandler(StubHandler):
+        requests = 0
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            system, user = (message["content"] for message in request["messages"])
+            time.sleep(latency)
+            if system == KEYWORDS_PROMPT:
+                entities = json.loads(user)
+                content = json.dumps(sorted(entities, key=entities.get, reverse=True)[:40])
+            else:
+                content = f"The word cloud highlights {len(json.loads(user))} keywords of the company's filings."
+            self.reply(200, json.dumps({"choices": [{"message": {"role": "assistant", "content": content}}]}))
+
+    return LLMHandler
+
+
+def ruler_pipeline(path):
+    """
+    Save a spaCy pipeline that tags the synthetic corpus' people, products and laws with an entity ruler.
+    It needs no model download and finds the same entities on every machine; the ruler is named "ner" so
+    visualisation.get_nlp keeps it enabled.
+    """
+    import spacy
+
+    nlp = spacy.blank("en")
+    ruler = nlp.add_pipe("entity_ruler", name="ner")
+    ruler.add_patterns([{"label": label, "pattern": pattern}
+                        for label, pool in (("PERSON", NAMES), ("PRODUCT", PRODUCTS), ("LAW", LAWS))
+                        for pattern in pool])
+    nlp.meta["name"] = "synthetic_ruler"
+    nlp.to_disk(path)
+    return path
+
+
+def bench_pipeline(args):
+    """
+    Run the batch pipeline end to end, offline: stub EDGAR and LLM servers serve a synthetic corpus, and
+    every cache (filing store, entity cache, entity series, LLM responses) starts empty in a scratch
+    directory. The same jobs run twice, cold and then warm, and the stage metrics of both runs are printed
+    and written as JSON.
+    """
+    import instrumentation
+    import ranking
+
+    output = os.path.abspath(args.output)
+    tickers = [f"SYN{index}" for index in range(args.tickers)]
+    companies = {9000001 + index: ticker for index, ticker in enumerate(tickers)}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        # Every cache and working directory of the pipeline is relative, so it all lands in the scratch directory.
+        os.chdir(directory)
+        os.makedirs("assets")
+        with open(os.path.join("assets", "company_tickers.json"), 'w', encoding='utf-8') as file:
+            json.dump({str(index): {"cik_str": cik, "ticker": ticker, "title": f"Synthetic Company {index} Inc."}
+                       for index, (cik, ticker) in enumerate(companies.items())}, file)
+        edgar, edgar_url = serve(stub_edgar(companies, args.start, args.end, args.paragraphs))
+        llm, llm_url = serve(stub_llm(args.llm_latency))
+        os.environ["TOGETHER_BASE_URL"] = llm_url
+
+        import visualisation
+        from batch import BatchEngine
+        from edgar import DownloadScheduler
+
+        visualisation.SPACY_MODEL = ruler_pipeline("ruler-model") if args.ner_model == "ruler" else args.ner_model
+        count_tokens = ranking.count_tokens
+        if not args.tiktoken:
+            # tiktoken may have to download its encoding; the estimate needs no network and sizes the
+            # entity payloads the same way on every machine.
+            ranking.count_tokens = lambda text, encoding=None: len(text) // 4 + 1
+        scheduler = DownloadScheduler(data_url=edgar_url, archive_url=edgar_url, rate=args.rate, backoff=0.01)
+        engine = BatchEngine(output_dir="batch-results", scheduler=scheduler)
+        runs = []
+        try:
+            for run in ("cold", "warm"):
+                instrumentation.reset()
+                requests_before = edgar.RequestHandlerClass.requests, llm.RequestHandlerClass.requests
+                start = time.perf_counter()
+                jobs = engine.run([(ticker, args.start, args.end) for ticker in tickers])
+                seconds = time.perf_counter() - start
+                metrics = instrumentation.snapshot()
+                runs.append({
+                    "run": run,
+                    "wall_seconds": round(seconds, 3),
+                    "edgar_requests": edgar.RequestHandlerClass.requests - requests_before[0],
+                    "llm_requests": llm.RequestHandlerClass.requests - requests_before[1],
+                    "jobs": [job.summary() for job in jobs],
+                    **metrics,
+                })
+                print_pipeline_run(runs[-1])
+        finally:
+            engine.close()
+            ranking.count_tokens = count_tokens
+            edgar.shutdown()
+            llm.shutdown()
+            os.chdir(cwd)
+
+    config = {key: value for key, value in vars(args).items() if key != "func"}
+    with open(output, 'w', encoding='utf-8') as file:
+        json.dump({"config": config, "runs": runs}, file, indent=1)
+    print(f"Metrics written to {output}")
+    failed = [job for run in runs for job in run["jobs"] if job["status"] != "done"]
+    for job in failed:
+        print(f"{job['ticker']} failed: {job['error']}")
+    return 1 if failed else 0
+
+
+def print_pipeline_run(run):
+    print(f"{run['run']} run: {run['wall_seconds']:.3f}s wall, {run['edgar_requests']} EDGAR requests, "
+          f"{run['llm_requests']} LLM requests, peak RSS {run['peak_rss_mb']:.0f} MB "
+          f"(largest worker {run['peak_child_rss_mb']:.0f} MB)")
+    print(f"  {'stage':<10} {'calls':>5} {'seconds':>9} {'items':>6} {'MB':>8} {'hits':>5} {'misses':>6}")
+    for name, stats in run["stages"].items():
+        print(f"  {name:<10} {stats['calls']:>5} {stats['seconds']:>9.3f} {stats['items']:>6} "
+              f"{stats['bytes'] / 1024 ** 2:>8.2f} {stats['cache_hits']:>5} {stats['cache_misses']:>6}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the SEC 10-K AI Analyser.")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    html = subparsers.add_parser("html", help="HTML-to-text conversion throughput")
+    html.add_argument("--filings", type=int, default=29)
+    html.add_argument("--paragraphs", type=int, default=4000)
+    html.add_argument("--workers", type=int, default=None)
+    html.set_defaults(func=bench_html)
+
+    ner = subparsers.add_parser("ner", help="spaCy NER docs/sec and peak RSS")
+    ner.add_argument("--filings", type=int, default=29)
+    ner.add_argument("--paragraphs", type=int, default=1500)
+    ner.add_argument("--chunk-chars", type=int, default=50000)
+    ner.add_argument("--processes", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    ner.add_argument("--single", action="store_true", help=argparse.SUPPRESS)
+    ner.set_defaults(func=bench_ner)
+
+    imports = subparsers.add_parser("imports", help="cold-start import times of the pipeline modules")
+    imports.add_argument("--repeat", type=int, default=5)
+    imports.set_defaults(func=bench_imports)
+
+    embed = subparsers.add_parser("embed", help="embedding pipeline throughput with a local backend")
+    embed.add_argument("--chunks", type=int, default=5000)
+    embed.add_argument("--dim", type=int, default=384)
+    embed.add_argument("--latency", type=float, default=0.05, help="simulated seconds per embedding request")
+    embed.add_argument("--in-flight", type=int, nargs="+", default=[1, 4, 8])
+    embed.set_defaults(func=bench_embed)
+
+    retrieval = subparsers.add_parser("retrieval", help="recall@k and latency of the embedding backends through the vector index")
+    retrieval.add_argument("--backends", nargs="+", default=["hashing", "tfidf"])
+    retrieval.add_argument("--filings", type=int, default=29)
+    retrieval.add_argument("--paragraphs", type=int, default=120)
+    retrieval.add_argument("--k", type=int, default=5)
+    retrieval.set_defaults(func=bench_retrieval)
+
+    hybrid = subparsers.add_parser("hybrid", help="recall@k and latency of BM25, vector and hybrid retrieval")
+    hybrid.add_argument("--backend", default="hashing")
+    hybrid.add_argument("--filings", type=int, default=29)
+    hybrid.add_argument("--paragraphs", type=int, default=120)
+    hybrid.add_argument("--k", type=int, default=5)
+    hybrid.set_defaults(func=bench_hybrid)
+
+    tickers = subparsers.add_parser("tickers", help="ticker -> CIK lookup and company search")
+    tickers.add_argument("--lookups", type=int, default=100000)
+    tickers.add_argument("--linear-lookups", type=int, default=50)
+    tickers.add_argument("--searches", type=int, default=100)
+    tickers.set_defaults(func=bench_tickers)
+
+    pipeline = subparsers.add_parser("pipeline", help="end-to-end stage metrics against stub EDGAR and LLM servers")
+    pipeline.add_argument("--tickers", type=int, default=3)
+    pipeline.add_argument("--start", type=int, default=2015)
+    pipeline.add_argument("--end", type=int, default=2022)
+    pipeline.add_argument("--paragraphs", type=int, default=600)
+    pipeline.add_argument("--llm-latency", type=float, default=0.2, help="simulated seconds per LLM request")
+    pipeline.add_argument("--rate", type=float, default=100, help="EDGAR requests per second")
+    pipeline.add_argument("--ner-model", default="ruler",
+                          help='spaCy model to load, or "ruler" for a deterministic entity ruler')
+    pipeline.add_argument("--tiktoken", action="store_true",
+                          help="count payload tokens with tiktoken instead of a 4-characters-per-token estimate")
+    pipeline.add_argument("--output", default="pipeline-metrics.json")
+    pipeline.set_defaults(func=bench_pipeline)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,152 @@
+import os
 import json
-import together
+import random
+import asyncio
+import threading
+from instrumentation import stage
+from llm_cache import ResponseCache, prompt_key
 
-# Initialize the Together API client using the provided API key.
-client = together.Together(api_key="API-KEY-HERE")
+"""
+Client layer for the Together chat-completions API. Requests are made asynchronously against the
+OpenAI-compatible HTTP endpoint with bounded concurrency, per-request timeouts and retries with
+exponential backoff, and every response is stored in a persistent, TTL-bound cache keyed by model and
+prompt. The base URL is configurable (TOGETHER_BASE_URL), so the client can run against a local mock
+chat-completions server. Synchronous wrappers keep the original important_words/text_generation API.
+"""
 
-def important_words(all_entities):
+LLM_MODEL = "mistralai/Mixtral-8x22B-Instruct-v0.1"
+TOGETHER_BASE_URL = "https://api.together.xyz/v1"
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+KEYWORDS_PROMPT = '''You have been provided with a Python dictionary containing keywords from 10-K filings spanning 1995 to 2023. Your task is to filter and compile a list of the top 100 keywords that are most relevant and specific to the company's unique context. Exclude all generic terms. Focus on extracting words that highlight key themes, significant people, pivotal products, notable events, and industry-specific trends that have uniquely influenced the company during the specified period. The selected keywords should be highly specific to the company, potentially including buzzwords, legislation, and individual figures directly linked to the company's operations. The goal is to ensure that these keywords, when visualized in a word cloud using frequency data, clearly depict the most critical aspects of the company's history and industry footprint. Also omit words associated with 10-K filings. All of these words must be diverse and not similar to each other. This reponse must be a JSON desponse, such that it can directly used as a json without a need for any more preporcessing'''
+ANALYSIS_PROMPT = "You are given a set of most important words or higlights for a given company based on the 10-K filing. The has been created into a eork clooud and displayed on the screen. You have anlayse them and tell them why the give a good insight and why using a word cloud is a good choice. Also touch on some of words and give insigths about them"
+
+_client = None
+_client_lock = threading.Lock()
+
+
+class LLMClient:
+    """
+    Settings and response cache shared by every request; open a session to make requests.
+
+    Args:
+        base_url (str): Base URL of the chat-completions API.
+        api_key (str): API key sent as a bearer token.
+        concurrency (int): Maximum number of requests in flight per session.
+        timeout (float): Total timeout in seconds for a single request.
+        max_retries (int): Retries for a request that times out or hits a 429/5xx status.
+        backoff (float): Base delay in seconds for exponential backoff between retries.
+        cache (ResponseCache): Response cache; None disables caching.
+    """
+
+    def __init__(self, base_url=TOGETHER_BASE_URL, api_key=None, concurrency=4, timeout=120,
+                 max_retries=3, backoff=1.0, cache=None):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.cache = cache
+
+    def session(self):
+        """Return an async context manager holding the HTTP connection pool for one event loop."""
+        return LLMSession(self)
+
+
+class LLMSession:
+    """An open connection pool and concurrency limit bound to the running event loop."""
+
+    def __init__(self, client):
+        self.client = client
+        self._http = None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        import aiohttp
+
+        headers = {"Authorization": f"Bearer {self.client.api_key}"} if self.client.api_key else {}
+        self._http = aiohttp.ClientSession(headers=headers, timeout=aiohttp.ClientTimeout(total=self.client.timeout))
+        self._semaphore = asyncio.Semaphore(self.client.concurrency)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._http.close()
+
+    async def complete(self, system, user, model=LLM_MODEL):
+        """
+        Run one chat completion, answering from the response cache when possible.
+
+        Args:
+            system (str): The system prompt.
+            user (str): The user message.
+            model (str): The model to use.
+
+        Returns:
+            str: The content of the first choice.
+        """
+        import aiohttp
+
+        messages = [{"role": "system", "content": system}, {"role": "user", "content": user}]
+        cache = self.client.cache
+        key = prompt_key(model, messages)
+        with stage("llm") as span:
+            span.add(bytes=len(system.encode("utf-8")) + len(user.encode("utf-8")), items=1)
+            if cache is not None:
+                cached = await asyncio.to_thread(cache.get, key)
+                if cached is not None:
+                    span.add(bytes=len(cached.encode("utf-8")), cache_hits=1)
+                    return cached
+                span.add(cache_misses=1)
+
+            url = f"{self.client.base_url}/chat/completions"
+            async with self._semaphore:
+                for attempt in range(self.client.max_retries + 1):
+                    retry_after = None
+                    try:
+                        async with self._http.post(url, json={"model": model, "messages": messages}) as response:
+                            if response.status not in RETRY_STATUSES or attempt == self.client.max_retries:
+                                response.raise_for_status()
+                                content = (await response.json())["choices"][0]["message"]["content"]
+                                break
+                            retry_after = response.headers.get("Retry-After")
+                    except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                        if attempt == self.client.max_retries:
+                            raise
+                    delay = self.client.backoff * 2 ** attempt + random.uniform(0, self.client.backoff)
+                    if retry_after and retry_after.isdigit():
+                        delay = max(delay, int(retry_after))
+                    await asyncio.sleep(delay)
+
+            span.add(bytes=len(content.encode("utf-8")))
+            if cache is not None:
+                await asyncio.to_thread(cache.put, key, model, content)
+        return content
+
+def get_client():
+    """
+    Return the shared LLM client, creating it on first use.
+
+    The API key and base URL are read from the TOGETHER_API_KEY and TOGETHER_BASE_URL environment
+    variables, and responses are cached on disk.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = LLMClient(
+                    base_url=os.environ.get("TOGETHER_BASE_URL", TOGETHER_BASE_URL),
+                    api_key=os.environ.get("TOGETHER_API_KEY", "API-KEY-HERE"),
+                    cache=ResponseCache(),
+                )
+    return _client
+
+async def important_words_async(session, all_entities):
     """
     Identifies important keywords from a dictionary of 10-K filing terms.
 
     Args:
+    session (LLMSession): An open session of the LLM client.
     all_entities (dict or str): A dictionary or JSON string containing keywords from 10-K filings.
 
     Returns:
@@ -16,50 +154,86 @@ def important_words(all_entities):
     """
     # Serialize the dictionary to a JSON string if it's not already a string.
     entities_json = json.dumps(all_entities) if not isinstance(all_entities, str) else all_entities
-    
+
     try:
         # Make an API request to generate keywords.
-        response = client.chat.completions.create(
-            model="mistralai/Mixtral-8x22B-Instruct-v0.1",
-            messages=[
-                {"role": "system", "content": '''You have been provided with a Python dictionary containing keywords from 10-K filings spanning 1995 to 2023. Your task is to filter and compile a list of the top 100 keywords that are most relevant and specific to the company's unique context. Exclude all generic terms. Focus on extracting words that highlight key themes, significant people, pivotal products, notable events, and industry-specific trends that have uniquely influenced the company during the specified period. The selected keywords should be highly specific to the company, potentially including buzzwords, legislation, and individual figures directly linked to the company's operations. The goal is to ensure that these keywords, when visualized in a word cloud using frequency data, clearly depict the most critical aspects of the company's history and industry footprint. Also omit words associated with 10-K filings. All of these words must be diverse and not similar to each other. This reponse must be a JSON desponse, such that it can directly used as a json without a need for any more preporcessing'''},
-                {"role": "user", "content": entities_json}
-            ]
-        )
-        # Extract and return the response in JSON format.
-        keywords = response.choices[0].message.content
-        return keywords
+        return await session.complete(KEYWORDS_PROMPT, entities_json)
 
     except Exception as e:
         # Handle exceptions and return an error message in JSON format.
         print(f"Failed to generate keywords due to: {e}")
         return json.dumps({"error": str(e)})
-    
-def text_generation(response):
+
+async def text_generation_async(session, response):
     """
     Generates a text analysis based on a set of keywords.
 
     Args:
+    session (LLMSession): An open session of the LLM client.
     response (str): A JSON string containing important keywords or highlights for a company.
 
     Returns:
     str: A JSON string containing an analysis of why using a word cloud is a good choice along with insights on specific words.
     """
-    
     try:
         # Make an API request to generate text analysis.
-        response = client.chat.completions.create(
-            model="mistralai/Mixtral-8x22B-Instruct-v0.1",
-            messages=[
-                {"role": "system", "content": "You are given a set of most important words or higlights for a given company based on the 10-K filing. The has been created into a eork clooud and displayed on the screen. You have anlayse them and tell them why the give a good insight and why using a word cloud is a good choice. Also touch on some of words and give insigths about them"},
-                {"role": "user", "content": response}
-            ]
-        )
-        # Extract and return the response in JSON format.
-        keywords = response.choices[0].message.content
-        return keywords
+        return await session.complete(ANALYSIS_PROMPT, response)
 
     except Exception as e:
         # Handle exceptions and return an error message in JSON format.
         print(f"Failed to generate keywords due to: {e}")
-        return json.dumps({"error": str(e)})
\ No newline at end of file
+        return json.dumps({"error": str(e)})
+
+async def analyse_async(session, all_entities, on_progress=None):
+    """
+    Get the keywords for a set of entities and then the narrative about those keywords.
+
+    Args:
+    on_progress (callable): Called with ``(requests done, 2)`` after each of the two requests.
+
+    Returns:
+    tuple: The keywords JSON string and the text analysis.
+    """
+    keywords = await important_words_async(session, all_entities)
+    if on_progress is not None:
+        on_progress(1, 2)
+    analysis = await text_generation_async(session, keywords)
+    if on_progress is not None:
+        on_progress(2, 2)
+    return keywords, analysis
+
+async def analyse_many_async(entities_by_key, client=None):
+    """
+    Analyse several entity sets (e.g. one per ticker) concurrently over a single session.
+
+    Args:
+    entities_by_key (dict): Maps a key such as a ticker to its entity counts.
+    client (LLMClient): The client to use; defaults to the shared client.
+
+    Returns:
+    dict: Maps each key to its ``(keywords, text analysis)`` tuple.
+    """
+    client = client or get_client()
+    async with client.session() as session:
+        results = await asyncio.gather(*(analyse_async(session, entities) for entities in entities_by_key.values()))
+    return dict(zip(entities_by_key, results))
+
+async def _with_session(function, *args):
+    async with get_client().session() as session:
+        return await function(session, *args)
+
+def important_words(all_entities):
+    """Synchronous wrapper around important_words_async using the shared client."""
+    return asyncio.run(_with_session(important_words_async, all_entities))
+
+def text_generation(response):
+    """Synchronous wrapper around text_generation_async using the shared client."""
+    return asyncio.run(_with_session(text_generation_async, response))
+
+def analyse(all_entities, on_progress=None):
+    """Synchronous wrapper around analyse_async: returns the keywords and the text analysis."""
+    return asyncio.run(_with_session(analyse_async, all_entities, on_progress))
+
+def analyse_many(entities_by_key, client=None):
+    """Synchronous wrapper around analyse_many_async."""
+    return asyncio.run(analyse_many_async(entities_by_key, client))
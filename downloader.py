@@ -5,104 +5,221 @@ import json
 import shutil
 import warnings
 import threading
-import sec_parser as sp
+from functools import partial
+from html.parser import HTMLParser
+from concurrent.futures import ProcessPoolExecutor
+from lxml import etree
 from bs4 import BeautifulSoup
-from sec_edgar_downloader import Downloader
-
-dl = Downloader("VIP Georgia Institute of Technology", "pmehta305@gatech.edu")
-
-def download_10k(ticker, start_year=1995, current_year=2023):
-    try:
-        dl.get("10-K", ticker, after=f"{start_year}-01-01", before=f"{current_year}-12-31",download_details=True)
-    except Exception as e:
-        print(f"Failed to download 10-K. Exception: {e}")
-
-def download_10k_threaded(ticker, start_year=1995, current_year=2023):
-    threads = []
-
-    def download_year(year):
-        try:
-            dl.get("10-K", ticker, after=f"{year}-01-01", before=f"{year}-12-31", download_details=True)
-        except Exception as e:
-            print(f"Failed to download 10-K for {ticker} in {year}. Exception: {e}")
-
-    for year in range(start_year, current_year + 1):
-        thread = threading.Thread(target=download_year, args=(year,))
-        threads.append(thread)
-        thread.start()
-
-    for thread in threads:
-        thread.join()
-
-
-def get_file_paths(ticker):
+from edgar import DownloadScheduler, YearResult
+from filing_store import FilingStore, accession_year
+from instrumentation import stage
+from tickers import get_index
+
+EDGAR_DIR = "sec-edgar-filings"
+
+_store = None
+_store_lock = threading.Lock()
+_scheduler = None
+_scheduler_lock = threading.Lock()
+_company_locks = {}
+_company_locks_lock = threading.Lock()
+
+def get_store():
+    """Return the filing store shared by get_files calls and the batch engine, opening it on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = FilingStore()
+    return _store
+
+def get_scheduler():
+    """Return the EDGAR scheduler shared by get_files calls and the batch engine, so its rate limit is global."""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = DownloadScheduler()
+    return _scheduler
+
+def company_lock(cik):
+    """
+    Return the lock held while a company's filings are downloaded into the store and cleaned, so two
+    calls for the same company do not fetch and clean its filings at the same time. It is keyed by CIK,
+    as the filing store is, so share classes such as GOOG and GOOGL share one lock.
+    """
+    with _company_locks_lock:
+        return _company_locks.setdefault(str(cik), threading.Lock())
+
+def download_10k(ticker, start_year=1995, current_year=2023, scheduler=None, root_dir="."):
+    return download_10k_threaded(ticker, start_year, current_year, scheduler=scheduler, root_dir=root_dir)
+
+def download_10k_threaded(ticker, start_year=1995, current_year=2023, years=None, scheduler=None, root_dir=".",
+                          on_progress=None):
+    # Downloads go through a bounded, rate-limited worker pool rather than one thread per year,
+    # and come back as one YearResult per year so callers can tell which filings arrived.
+    if years is None:
+        years = range(start_year, current_year + 1)
+
+    cik = get_cik_number_from_file(ticker)
+    if cik is None:
+        print(f"Failed to download 10-K for {ticker}. Exception: unknown ticker")
+        return [YearResult(year=year, status="failed", error="unknown ticker") for year in years]
+
+    if scheduler is None:
+        scheduler = get_scheduler()
+    results = scheduler.download(cik, years, os.path.join(root_dir, EDGAR_DIR, ticker, "10-K"), on_progress)
+    for result in results:
+        if not result.ok:
+            print(f"Failed to download 10-K for {ticker} in {result.year}. Exception: {result.error}")
+    return results
+
+
+def get_file_paths(ticker, root_dir="."):
     html_files = []
-    directory = f"sec-edgar-filings/{ticker}/10-K/"
+    directory = os.path.join(root_dir, EDGAR_DIR, ticker, "10-K")
     html_files = glob.glob(os.path.join(directory, "*", "primary-document.html"))
     non_html_files = glob.glob(os.path.join(directory, "*", "primary-document"))
     all_files = html_files + non_html_files
     return all_files
 
-def remove_html_tags(input_file_path):
-    # Read the HTML file
-    with open(input_file_path, 'r', encoding='utf-8') as file:
-        html_content = file.read()
-
-    # Parse HTML using BeautifulSoup
-    soup = BeautifulSoup(html_content, 'html.parser')
+# Elements whose content is not document text, matching what BeautifulSoup's get_text() leaves out.
+SKIPPED_TAGS = {"script", "style", "template"}
+HTML_BACKENDS = ("lxml", "html.parser", "bs4")
+READ_CHUNK_SIZE = 1024 * 1024
+
+class _LxmlTextTarget:
+    """Parser target that streams character data straight to a file as lxml tokenises the input."""
+
+    def __init__(self, out):
+        self.out = out
+        self.skip_depth = 0
+
+    def start(self, tag, attrib):
+        if tag in SKIPPED_TAGS:
+            self.skip_depth += 1
+
+    def end(self, tag):
+        if tag in SKIPPED_TAGS and self.skip_depth:
+            self.skip_depth -= 1
+
+    def data(self, data):
+        if not self.skip_depth:
+            self.out.write(data)
+
+    def close(self):
+        pass
+
+class _StdlibTextExtractor(HTMLParser):
+    """Incremental tokenizer built on the standard library's HTMLParser; no tree is ever built."""
+
+    def __init__(self, out):
+        super().__init__(convert_charrefs=True)
+        self.out = out
+        self.skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TAGS:
+            self.skip_depth += 1
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS and self.skip_depth:
+            self.skip_depth -= 1
+
+    def handle_data(self, data):
+        if not self.skip_depth:
+            self.out.write(data)
+
+def html_to_text(input_file, output_file, backend="lxml"):
+    """
+    Extract the text of an HTML document from one open file into another.
+
+    Args:
+        input_file (file): Text-mode file object holding the HTML.
+        output_file (file): Text-mode file object receiving the extracted text.
+        backend (str): "lxml" (streaming lxml parser, the fastest), "html.parser" (streaming standard
+            library tokenizer) or "bs4" (builds a full BeautifulSoup tree, the original behaviour).
+    """
+    if backend == "bs4":
+        soup = BeautifulSoup(input_file.read(), 'html.parser')
+        output_file.write(soup.get_text())
+        return
+
+    if backend == "lxml":
+        parser = etree.HTMLParser(target=_LxmlTextTarget(output_file), huge_tree=True)
+    elif backend == "html.parser":
+        parser = _StdlibTextExtractor(output_file)
+    else:
+        raise ValueError(f"Unknown HTML backend {backend!r}, expected one of {HTML_BACKENDS}")
 
-    # Extract text from the HTML
-    text = soup.get_text()
+    # Feed the document in fixed-size chunks so memory stays flat however large the filing is.
+    for chunk in iter(lambda: input_file.read(READ_CHUNK_SIZE), ""):
+        parser.feed(chunk)
+    parser.close()
 
+def cleaned_file_path(input_file_path):
     # Create a new filename for the cleaned HTML file
     filename, extension = os.path.splitext(os.path.basename(input_file_path))
-    year = int(input_file_path[input_file_path.index("10-K/") + 16: input_file_path.index("10-K/") + 18])
-    if (int(year) < 25 ):
-        year += 2000
-    else:
-        year += 1900
+    year = accession_year(os.path.basename(os.path.dirname(input_file_path)))
     cleaned_filename = filename +"-" + str(year) +"_cleaned.txt"
+    return os.path.join(os.path.dirname(input_file_path), cleaned_filename)
 
-    # Write the cleaned text to a new file
-    output_file_path = os.path.join(os.path.dirname(input_file_path), cleaned_filename)
-    with open(output_file_path, 'w', encoding='utf-8') as file:
-        file.write(text)
+def remove_html_tags(input_file_path, output_file_path=None, backend="lxml"):
+    if output_file_path is None:
+        output_file_path = cleaned_file_path(input_file_path)
 
-    # print(f"Cleaned HTML saved to: {output_file_path}")
+    # Skip files whose cleaned output is already newer than the source.
+    if os.path.exists(output_file_path) and os.path.getmtime(output_file_path) >= os.path.getmtime(input_file_path):
+        return output_file_path
 
-def cleaned_data_files(ticker, root_dir="."):
-    # Create a new folder named "data"
-    data_folder_path = os.path.join(root_dir, f"data-{ticker}")
-    os.makedirs(data_folder_path, exist_ok=True)
-
-    # Keep track of copied files
-    copied_files = set()
+    # Write the cleaned text to a new file
+    with open(input_file_path, 'r', encoding='utf-8', errors='replace') as input_file, \
+            open(output_file_path, 'w', encoding='utf-8') as output_file:
+        html_to_text(input_file, output_file, backend=backend)
 
-    # Traverse through the directory tree
-    for root, dirs, files in os.walk(root_dir):
-        for file in files:
-            # Check if the file ends with "_cleaned.txt"
-            if file.endswith("_cleaned.txt"):
-                # Get the full path of the cleaned file
-                cleaned_file_path = os.path.join(root, file)
-
-                # Check if the file has already been copied
-                if cleaned_file_path not in copied_files:
-                    # Construct the destination path
-                    destination_file_path = os.path.join(data_folder_path, file)
-                    
-                    # Check if the destination file exists and is not the same as the source file
-                    if not os.path.exists(destination_file_path) or not os.path.samefile(cleaned_file_path, destination_file_path):
-                        # Copy the cleaned file to the "data" folder
-                        shutil.copy(cleaned_file_path, data_folder_path)
-                        # Add the file to the set of copied files
-                        copied_files.add(cleaned_file_path)
-
-    print("Cleaned files copied to 'data' folder.")
+    # print(f"Cleaned HTML saved to: {output_file_path}")
+    return output_file_path
+
+def convert_filings(input_file_paths, output_file_paths=None, backend="lxml", max_workers=None, on_progress=None):
+    """
+    Convert many filings to text in parallel on a process pool.
+
+    Args:
+        input_file_paths (list): Paths of the raw HTML filings.
+        output_file_paths (list): Where to write each cleaned file; defaults to next to its input.
+        backend (str): The HTML backend to use, see html_to_text.
+        max_workers (int): Number of worker processes; defaults to the number of CPUs.
+        on_progress (callable): Called with ``(files done, files total)`` after each file.
+
+    Returns:
+        list: The cleaned output paths, in the same order as the inputs.
+    """
+    if output_file_paths is None:
+        output_file_paths = [cleaned_file_path(path) for path in input_file_paths]
+    convert = partial(remove_html_tags, backend=backend)
+    outputs = []
+    with stage("clean") as span:
+        span.add(bytes=sum(os.path.getsize(path) for path in input_file_paths))
+        if len(input_file_paths) <= 1:
+            results = map(convert, input_file_paths, output_file_paths)
+            executor = None
+        else:
+            executor = ProcessPoolExecutor(max_workers=max_workers)
+            results = executor.map(convert, input_file_paths, output_file_paths)
+        try:
+            for output in results:
+                outputs.append(output)
+                span.add(items=1)
+                if on_progress is not None:
+                    on_progress(len(outputs), len(input_file_paths))
+        finally:
+            if executor is not None:
+                executor.shutdown()
+    return outputs
 
 def delete_sec_edgar_folder(root_dir="."):
 
-    sec_edgar_filing_folder = os.path.join(root_dir, "sec-edgar-filings")
+    sec_edgar_filing_folder = os.path.join(root_dir, EDGAR_DIR)
 
     # Check if the folder exists
     if os.path.exists(sec_edgar_filing_folder):
@@ -112,32 +229,134 @@ def delete_sec_edgar_folder(root_dir="."):
     else:
         print("sec-edgar-filings folder does not exist.")
 
-def parse_10k(html_path):
+# Headings of the standard 10-K Items; a heading like "ITEM 1A." is recognised in parsed titles and in text.
+ITEM_HEADING = re.compile(r"^\s*item\s+(\d{1,2}[a-c]?)\s*[.:\-\u2013\u2014]?\s*(.*)$", re.IGNORECASE | re.DOTALL)
+ITEM_LINE = re.compile(r"^[ \t]*item[ \t]+(\d{1,2}[a-c]?)[ \t]*[.:\-\u2013\u2014]?[ \t]*(.*)$", re.IGNORECASE | re.MULTILINE)
+ITEM_TITLES = {
+    "1": "Business", "1A": "Risk Factors", "1B": "Unresolved Staff Comments", "1C": "Cybersecurity",
+    "2": "Properties", "3": "Legal Proceedings", "4": "Mine Safety Disclosures",
+    "5": "Market for Registrant's Common Equity", "6": "Selected Financial Data",
+    "7": "Management's Discussion and Analysis", "7A": "Quantitative and Qualitative Disclosures About Market Risk",
+    "8": "Financial Statements and Supplementary Data", "9": "Changes in and Disagreements with Accountants",
+    "9A": "Controls and Procedures", "9B": "Other Information", "10": "Directors, Executive Officers and Corporate Governance",
+    "11": "Executive Compensation", "12": "Security Ownership", "13": "Certain Relationships and Related Transactions",
+    "14": "Principal Accountant Fees and Services", "15": "Exhibits and Financial Statement Schedules",
+}
+
+def parse_10k_elements(html_path):
+    import sec_parser as sp
 
     parser = sp.Edgar10QParser()
-    with open(html_path, 'r', encoding='utf-8') as file:
+    with open(html_path, 'r', encoding='utf-8', errors='replace') as file:
         html_content = file.read()
         with warnings.catch_warnings():
             warnings.filterwarnings("ignore", message="Invalid section type for")
             elements = parser.parse(html_content)
+    return elements
+
+def parse_10k(html_path):
+    import sec_parser as sp
+
+    elements = parse_10k_elements(html_path)
     tree = sp.TreeBuilder().build(elements)
-    print(elements)
     # print(tree.render())
 
     return tree
 
-def get_cik_number_from_file(ticker):
-    # Open the JSON file
-    with open('assets/company_tickers.json', 'r') as file:
-        data = json.load(file)
-
-    # Searching for the ticker in the JSON data
-    for _, company_info in data.items():
-        if company_info['ticker'] == ticker:
-            return company_info['cik_str']
+class _SectionCollector:
+    """Accumulates text under the current Item; repeated headings (e.g. the table of contents) merge."""
+
+    def __init__(self):
+        self.sections = {}
+        self.current = self._section("Cover", "Cover Page")
+
+    def _section(self, item, title):
+        if item not in self.sections:
+            self.sections[item] = {"item": item, "title": title, "parts": []}
+        return self.sections[item]
+
+    def start(self, number, heading):
+        number = number.upper()
+        title = ITEM_TITLES.get(number) or heading.strip().split("\n")[0][:120]
+        self.current = self._section(f"Item {number}", title)
+
+    def add(self, text):
+        if text.strip():
+            self.current["parts"].append(text.strip())
+
+    def result(self):
+        return [
+            {"item": section["item"], "title": section["title"], "text": "\n\n".join(section["parts"])}
+            for section in self.sections.values() if section["parts"]
+        ]
+
+def split_text_sections(text):
+    """
+    Split cleaned 10-K text into Items using heading lines alone, for filings sec_parser cannot structure
+    (such as pre-2001 plain-text submissions).
+
+    Returns:
+        list: Sections as dicts with ``item``, ``title`` and ``text``.
+    """
+    collector = _SectionCollector()
+    position = 0
+    for match in ITEM_LINE.finditer(text):
+        collector.add(text[position:match.start()])
+        collector.start(match.group(1), match.group(2))
+        position = match.end()
+    collector.add(text[position:])
+    return collector.result()
+
+def split_10k_sections(html_path):
+    """
+    Split a 10-K into its Items (Item 1 Business, Item 1A Risk Factors, Item 7 MD&A, ...) using the
+    semantic elements sec_parser finds.
+
+    Returns:
+        list: Sections in document order as dicts with ``item``, ``title`` and ``text``.
+    """
+    import sec_parser as sp
+
+    collector = _SectionCollector()
+    for element in parse_10k_elements(html_path):
+        if isinstance(element, (sp.PageHeaderElement, sp.PageNumberElement, sp.EmptyElement, sp.IrrelevantElement)):
+            continue
+        text = element.text
+        match = ITEM_HEADING.match(text) if isinstance(element, (sp.TopSectionTitle, sp.TitleElement)) else None
+        if match:
+            collector.start(match.group(1), match.group(2))
+        else:
+            collector.add(text)
+    return collector.result()
+
+def write_sections(raw_file_path, text_file_path, output_file_path):
+    """
+    Write a filing's sections as JSON, falling back to heading lines in the cleaned text when sec_parser
+    fails or finds no Items.
+    """
+    try:
+        sections = split_10k_sections(raw_file_path)
+    except Exception:
+        sections = []
+    if len([section for section in sections if section["item"] != "Cover"]) < 2:
+        with open(text_file_path, 'r', encoding='utf-8') as file:
+            sections = split_text_sections(file.read())
+    with open(output_file_path, 'w', encoding='utf-8') as file:
+        json.dump(sections, file)
+    return output_file_path
+
+def index_sections(raw_file_paths, cleaned_file_paths, output_file_paths, max_workers=None):
+    """Split many filings into sections in parallel on a process pool."""
+    with stage("sections") as span:
+        span.add(bytes=sum(os.path.getsize(path) for path in raw_file_paths), items=len(raw_file_paths))
+        if len(raw_file_paths) <= 1:
+            return [write_sections(*paths) for paths in zip(raw_file_paths, cleaned_file_paths, output_file_paths)]
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(write_sections, raw_file_paths, cleaned_file_paths, output_file_paths))
 
-    # If the ticker is not found, return None
-    return None
+def get_cik_number_from_file(ticker):
+    # Look the ticker up in the index built once from assets/company_tickers.json; None if it is unknown.
+    return get_index().cik(ticker)
 
 def get_all_paths(directory):
 
@@ -150,12 +369,86 @@ def get_all_paths(directory):
     
     return file_paths
 
-def get_files(ticker, start_year= 1995, current_year=2023):
-
-    download_10k_threaded(ticker, start_year,current_year=current_year)
-    html_paths = get_file_paths(ticker)
-    for path in html_paths:
-        remove_html_tags(path)
-
-    cleaned_data_files(ticker)
-    delete_sec_edgar_folder()
\ No newline at end of file
+def data_dir(ticker, root_dir="."):
+    """Return the folder the cleaned filings of a ticker are exported to."""
+    return os.path.join(root_dir, f"data-{ticker}")
+
+def fetch_filings(ticker, start_year, current_year, store, root_dir=".", scheduler=None, on_progress=None):
+    """
+    Download the years of a range the filing store does not hold yet and move them into the store.
+
+    Args:
+        ticker (str): The ticker symbol.
+        start_year (int): First year of the range.
+        current_year (int): Last year of the range.
+        store (FilingStore): The filing store.
+        root_dir (str): Working directory the download is staged in.
+        scheduler (DownloadScheduler): Optionally share a scheduler (and its rate limit) between calls.
+        on_progress (callable): Called with ``(years done, years total)`` as the download proceeds.
+
+    Returns:
+        tuple: The CIK, a dict mapping the accessions moved into the store that still need cleaning to
+        their filing years, and the years EDGAR answered for.
+    """
+    cik = get_cik_number_from_file(ticker) or ticker
+
+    with stage("download") as span:
+        # Only go to EDGAR for the years the filing store does not already hold.
+        missing_years = store.missing_years(cik, start_year, current_year)
+        span.add(cache_hits=current_year - start_year + 1 - len(missing_years), cache_misses=len(missing_years))
+        if not missing_years:
+            return cik, {}, []
+        results = download_10k_threaded(ticker, years=missing_years, scheduler=scheduler, root_dir=root_dir,
+                                        on_progress=on_progress)
+        # Filings are keyed by the year of their EDGAR filing date, not the two-digit year in the accession.
+        filing_years = {accession: result.year for result in results for accession in result.accessions}
+        # Move each new filing into the store, so the cleaned text is written once, straight to its final location.
+        accessions = {}
+        for path in get_file_paths(ticker, root_dir):
+            accession = os.path.basename(os.path.dirname(path))
+            if not store.has(cik, accession):
+                span.add(bytes=os.path.getsize(path), items=1)
+                store.put_raw(cik, accession, path)
+                accessions[accession] = filing_years.get(accession)
+        delete_sec_edgar_folder(root_dir)
+        return cik, accessions, [result.year for result in results if result.ok]
+
+def clean_filings(cik, ticker, accessions, checked_years, store, max_workers=None, on_progress=None):
+    """
+    Convert fetched filings to text inside the store and record them, then mark their years as checked.
+
+    Args:
+        accessions (dict): Maps each accession to its filing year, as returned by fetch_filings.
+    """
+    convert_filings([store.raw_path(cik, accession) for accession in accessions],
+                    [store.cleaned_path(cik, accession) for accession in accessions], max_workers=max_workers,
+                    on_progress=on_progress)
+    for accession, year in accessions.items():
+        store.add(cik, ticker, accession, year)
+    store.mark_checked(cik, checked_years)
+
+def export_filings(cik, ticker, start_year, current_year, store, root_dir=".", sections=True):
+    """
+    Export the stored filings of a year range to the ticker's data folder. Filings are first split into
+    their Items for section-aware chunking in the RAG model, once per filing, unless ``sections`` is False.
+
+    Returns:
+        list: The manifest entries written to the data folder.
+    """
+    if sections:
+        pending = [entry["accession"] for entry in store.filings(cik, start_year, current_year)
+                   if not os.path.exists(store.sections_path(cik, entry["accession"]))]
+        index_sections([store.raw_path(cik, accession) for accession in pending],
+                       [store.cleaned_path(cik, accession) for accession in pending],
+                       [store.sections_path(cik, accession) for accession in pending])
+    return store.export(cik, start_year, current_year, data_dir(ticker, root_dir))
+
+def get_files(ticker, start_year= 1995, current_year=2023, store=None, sections=True, root_dir=".", scheduler=None):
+    if store is None:
+        store = get_store()
+    with company_lock(get_cik_number_from_file(ticker) or ticker):
+        cik, accessions, checked_years = fetch_filings(ticker, start_year, current_year, store, root_dir, scheduler)
+        if accessions or checked_years:
+            clean_filings(cik, ticker, accessions, checked_years, store)
+        export_filings(cik, ticker, start_year, current_year, store, root_dir, sections)
+    store.evict()
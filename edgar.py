@@ -0,0 +1,194 @@
+import os
+import time
+import random
+import threading
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+"""
+A bounded download scheduler for SEC EDGAR. Filings are fetched by a fixed-size worker pool that shares
+a token-bucket rate limiter (SEC allows at most 10 requests per second), each worker keeps its own HTTP
+session and connection pool, and throttled or failing requests (429/5xx) are retried with exponential
+backoff. Results are reported per year so callers know exactly which filings arrived. The EDGAR base
+URLs are configurable, which lets the scheduler run against a local stub server.
+"""
+
+USER_AGENT = "VIP Georgia Institute of Technology pmehta305@gatech.edu"
+DATA_URL = "https://data.sec.gov"
+ARCHIVE_URL = "https://www.sec.gov"
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: ``rate`` tokens are added per second up to ``capacity``, and every
+    request takes one token, blocking until one is available.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+@dataclass
+class YearResult:
+    """The outcome of downloading one year's 10-K filings."""
+    year: int
+    status: str  # "ok", "empty" (no 10-K filed that year) or "failed"
+    paths: list = field(default_factory=list)
+    accessions: list = field(default_factory=list)
+    error: str = None
+
+    @property
+    def ok(self):
+        return self.status != "failed"
+
+
+class DownloadScheduler:
+    """
+    Downloads 10-K primary documents for a company over a set of years.
+
+    Args:
+        max_workers (int): Size of the worker pool, i.e. the maximum number of concurrent requests.
+        rate (float): Requests per second allowed across all workers.
+        max_retries (int): Retries for a request that hits a 429/5xx status or a connection error.
+        backoff (float): Base delay in seconds for exponential backoff between retries.
+        timeout (float): Per-request timeout in seconds.
+        data_url (str): Base URL serving the submissions JSON (``data.sec.gov``).
+        archive_url (str): Base URL serving the filing archives (``www.sec.gov``).
+    """
+
+    def __init__(self, max_workers=4, rate=8, max_retries=5, backoff=0.5, timeout=30,
+                 data_url=DATA_URL, archive_url=ARCHIVE_URL, user_agent=USER_AGENT):
+        self.max_workers = max_workers
+        self.limiter = TokenBucket(rate)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.data_url = data_url.rstrip("/")
+        self.archive_url = archive_url.rstrip("/")
+        self.user_agent = user_agent
+        self._local = threading.local()
+
+    def _session(self):
+        # Each worker thread gets its own session so connections are pooled but never shared.
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.headers.update({"User-Agent": self.user_agent, "Accept-Encoding": "gzip, deflate"})
+            session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+            session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+            self._local.session = session
+        return session
+
+    def _get(self, url):
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            try:
+                response = self._session().get(url, timeout=self.timeout)
+            except requests.RequestException:
+                if attempt == self.max_retries:
+                    raise
+                retry_after = None
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                    response.raise_for_status()
+                    return response
+                retry_after = response.headers.get("Retry-After")
+            delay = self.backoff * 2 ** attempt + random.uniform(0, self.backoff)
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, int(retry_after))
+            time.sleep(delay)
+
+    def list_10k_filings(self, cik):
+        """
+        List a company's 10-K filings from its EDGAR submissions history.
+
+        Returns:
+            list: ``(filing_year, accession, primary_document)`` tuples.
+        """
+        submissions = self._get(f"{self.data_url}/submissions/CIK{int(cik):010d}.json").json()
+        pages = [submissions["filings"]["recent"]]
+        for extra in submissions["filings"].get("files", []):
+            pages.append(self._get(f"{self.data_url}/submissions/{extra['name']}").json())
+
+        filings = []
+        for page in pages:
+            for form, date, accession, document in zip(page["form"], page["filingDate"],
+                                                        page["accessionNumber"], page["primaryDocument"]):
+                if form == "10-K":
+                    filings.append((int(date[:4]), accession, document))
+        return filings
+
+    def _download_year(self, cik, year, filings, dest_dir):
+        result = YearResult(year=year, status="ok" if filings else "empty")
+        try:
+            for accession, document in filings:
+                base = f"{self.archive_url}/Archives/edgar/data/{int(cik)}/{accession.replace('-', '')}"
+                # Filings from before ~2001 have no separate primary document, only the full submission.
+                if document:
+                    url, filename = f"{base}/{document}", "primary-document.html"
+                else:
+                    url, filename = f"{base}/{accession}.txt", "primary-document"
+                content = self._get(url).content
+
+                filing_dir = os.path.join(dest_dir, accession)
+                os.makedirs(filing_dir, exist_ok=True)
+                path = os.path.join(filing_dir, filename)
+                with open(path, 'wb') as file:
+                    file.write(content)
+                result.paths.append(path)
+                result.accessions.append(accession)
+        except Exception as e:
+            result.status = "failed"
+            result.error = str(e)
+        return result
+
+    def download(self, cik, years, dest_dir, on_progress=None):
+        """
+        Download the 10-K filings of a company for the given years into ``dest_dir/{accession}/``.
+
+        Args:
+            cik (int or str): The company's CIK number.
+            years (iterable): The filing years to download.
+            dest_dir (str): Directory that receives one sub-folder per accession number.
+            on_progress (callable): Called with ``(years done, years total)`` as each year finishes.
+
+        Returns:
+            list: One YearResult per requested year, in ascending year order.
+        """
+        years = sorted(set(years))
+        try:
+            listing = self.list_10k_filings(cik)
+        except Exception as e:
+            return [YearResult(year=year, status="failed", error=str(e)) for year in years]
+
+        by_year = {year: [] for year in years}
+        for year, accession, document in listing:
+            if year in by_year:
+                by_year[year].append((accession, document))
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(self._download_year, cik, year, by_year[year], dest_dir) for year in years]
+            if on_progress is not None:
+                for done, _ in enumerate(as_completed(futures), 1):
+                    on_progress(done, len(futures))
+            return [future.result() for future in futures]
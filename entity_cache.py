@@ -0,0 +1,82 @@
+import json
+import time
+import zlib
+import sqlite3
+import threading
+from contextlib import closing
+
+"""
+A persistent cache of per-filing entity counts. Named entity recognition is deterministic for a given
+filing text and spaCy model, so counts are stored in SQLite keyed by the SHA-256 of the cleaned text and
+a model key (model name, version and extraction settings). Counts are kept as zlib-compressed JSON to
+keep the database compact.
+"""
+
+ENTITY_CACHE_PATH = "entity-cache.sqlite"
+
+
+class EntityCache:
+    """
+    SQLite-backed map of ``(content_hash, model) -> {entity: count}``.
+
+    Args:
+        path (str): Location of the SQLite database file.
+    """
+
+    def __init__(self, path=ENTITY_CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS entity_counts ("
+                " content_hash TEXT NOT NULL,"
+                " model TEXT NOT NULL,"
+                " counts BLOB NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " PRIMARY KEY (content_hash, model))"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get_many(self, content_hashes, model):
+        """
+        Look up the cached entity counts of several filings.
+
+        Args:
+            content_hashes (list): SHA-256 digests of the filings' cleaned text.
+            model (str): The model key the counts were produced with.
+
+        Returns:
+            dict: ``{content_hash: {entity: count}}`` for the hashes that are cached.
+        """
+        content_hashes = list(set(content_hashes))
+        found = {}
+        with self._lock, closing(self._connect()) as connection:
+            # Stay well below SQLite's limit on the number of bound parameters.
+            for start in range(0, len(content_hashes), 500):
+                batch = content_hashes[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = connection.execute(
+                    f"SELECT content_hash, counts FROM entity_counts WHERE model = ? AND content_hash IN ({placeholders})",
+                    [model] + batch,
+                )
+                for content_hash, blob in rows:
+                    found[content_hash] = json.loads(zlib.decompress(blob))
+        return found
+
+    def put_many(self, counts_by_hash, model):
+        """
+        Store the entity counts of several filings.
+
+        Args:
+            counts_by_hash (dict): ``{content_hash: {entity: count}}``.
+            model (str): The model key the counts were produced with.
+        """
+        now = time.time()
+        rows = [
+            (content_hash, model, zlib.compress(json.dumps(dict(counts)).encode("utf-8")), now)
+            for content_hash, counts in counts_by_hash.items()
+        ]
+        with self._lock, closing(self._connect()) as connection, connection:
+            connection.executemany("INSERT OR REPLACE INTO entity_counts VALUES (?, ?, ?, ?)", rows)
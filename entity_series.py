@@ -0,0 +1,185 @@
+import os
+import re
+import hashlib
+import threading
+from collections import Counter
+
+import numpy as np
+
+from ranking import normalise_entity
+
+"""
+Year-sliced entity counts for one company. Entities are normalised and merged as in ranking, and their
+counts are held in a dense (year x entity) matrix with a row of prefix sums on top, so the totals for any
+start_year..end_year window are one vector subtraction: moving the year slider or asking for a trend
+never touches the filings' text again. Series are saved as .npz files keyed by the filings and the NER
+model they were built from.
+"""
+
+SERIES_DIR = "entity-series"
+CLEANED_YEAR = re.compile(r"-(\d{4})_cleaned\.txt$")
+
+
+def filing_year(filing):
+    """Return a filing's year from its manifest entry, or from its ``-{year}_cleaned.txt`` file name."""
+    if filing.get("year") is not None:
+        return int(filing["year"])
+    match = CLEANED_YEAR.search(filing["path"])
+    return int(match.group(1)) if match else None
+
+
+def series_key(filings, model):
+    """Identify the filings (by content hash and year) and the NER model a series is built from."""
+    digest = hashlib.sha256(model.encode("utf-8"))
+    for filing in sorted(filings, key=lambda filing: filing["sha256"]):
+        digest.update(f"{filing['sha256']}:{filing_year(filing)}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class EntitySeries:
+    """
+    Entity counts per year.
+
+    Args:
+        first_year (int): The year of the first row.
+        entities (list): Entity names, one per column.
+        matrix (array-like): ``(years, entities)`` counts; row i holds year ``first_year + i``.
+        key (str): Identifies what the series was built from, see series_key.
+    """
+
+    def __init__(self, first_year, entities, matrix, key=None):
+        self.first_year = int(first_year)
+        self.entities = list(entities)
+        self.matrix = np.asarray(matrix, dtype=np.int32)
+        self.key = key
+        self.columns = {entity: column for column, entity in enumerate(self.entities)}
+        # prefix[i] holds the totals of the first i years, so a window is prefix[end + 1] - prefix[start].
+        self.prefix = np.zeros((len(self.matrix) + 1, len(self.entities)), dtype=np.int64)
+        np.cumsum(self.matrix, axis=0, out=self.prefix[1:])
+
+    @classmethod
+    def from_counts(cls, years, per_filing, key=None):
+        """
+        Build a series from per-filing entity counts.
+
+        Args:
+            years (list): The year of each filing; filings without a year are skipped.
+            per_filing (list): One ``{entity: count}`` mapping per filing.
+            key (str): Stored with the series, see series_key.
+        """
+        totals = {}
+        spellings = {}
+        for year, counts in zip(years, per_filing):
+            if year is None:
+                continue
+            year_totals = totals.setdefault(year, Counter())
+            for entity, count in counts.items():
+                surface = normalise_entity(entity)
+                if not surface:
+                    continue
+                year_totals[surface.casefold()] += count
+                spellings.setdefault(surface.casefold(), Counter())[surface] += count
+
+        if not totals:
+            return cls(0, [], np.zeros((0, 0)), key)
+        # Every merged entity is shown with its most frequent spelling across all years.
+        keys = sorted(spellings)
+        columns = {entity: column for column, entity in enumerate(keys)}
+        first_year, last_year = min(totals), max(totals)
+        matrix = np.zeros((last_year - first_year + 1, len(keys)), dtype=np.int32)
+        for year, year_totals in totals.items():
+            row = matrix[year - first_year]
+            for entity, count in year_totals.items():
+                row[columns[entity]] = count
+        return cls(first_year, [spellings[entity].most_common(1)[0][0] for entity in keys], matrix, key)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(int(data["first_year"]), data["entities"].tolist(), data["matrix"], str(data["key"]))
+
+    def save(self, path):
+        """Write the series to an .npz file, atomically."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Jobs for the same ticker can save its series at once; each writes its own temporary file.
+        tmp_path = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp.npz"
+        np.savez_compressed(tmp_path, first_year=self.first_year, entities=np.array(self.entities, dtype=str),
+                            matrix=self.matrix, key=self.key or "")
+        os.replace(tmp_path, path)
+
+    @property
+    def years(self):
+        return list(range(self.first_year, self.first_year + len(self.matrix)))
+
+    def _rows(self, start_year=None, end_year=None):
+        start = 0 if start_year is None else min(max(start_year - self.first_year, 0), len(self.matrix))
+        end = len(self.matrix) if end_year is None else min(end_year - self.first_year + 1, len(self.matrix))
+        return start, max(start, end)
+
+    def window(self, start_year=None, end_year=None):
+        """Return the total count of every entity over a year range, as a vector aligned with ``entities``."""
+        start, end = self._rows(start_year, end_year)
+        return self.prefix[end] - self.prefix[start]
+
+    def counts(self, start_year=None, end_year=None, top=None):
+        """
+        Return the entities mentioned in a year range with their total counts.
+
+        Args:
+            top (int): Only return the ``top`` most frequent entities.
+
+        Returns:
+            dict: ``{entity: count}``, most frequent first.
+        """
+        totals = self.window(start_year, end_year)
+        order = np.flatnonzero(totals)
+        order = order[np.argsort(-totals[order], kind="stable")]
+        if top is not None:
+            order = order[:top]
+        return {self.entities[column]: int(totals[column]) for column in order}
+
+    def per_year(self, start_year=None, end_year=None):
+        """Return one ``{entity: count}`` dict per year in the range that has any counts."""
+        start, end = self._rows(start_year, end_year)
+        years = []
+        for row in self.matrix[start:end]:
+            columns = np.flatnonzero(row)
+            if len(columns):
+                years.append({self.entities[column]: int(row[column]) for column in columns})
+        return years
+
+    def yearly(self, entities, start_year=None, end_year=None):
+        """Return the yearly counts of the given entities over a year range, as ``{entity: [counts]}``."""
+        start, end = self._rows(start_year, end_year)
+        return {
+            entity: self.matrix[start:end, self.columns[entity]].tolist()
+            for entity in entities if entity in self.columns
+        }
+
+    def trends(self, start_year=None, end_year=None, top=10, min_count=5):
+        """
+        Find the entities rising and fading fastest over a year range.
+
+        Each entity's yearly share of all entity mentions is fitted with a least-squares line; years with
+        no filing are left out. Only entities mentioned at least ``min_count`` times in the range qualify.
+
+        Returns:
+            tuple: Two lists of ``(entity, slope)``: the steepest rising and the steepest fading entities,
+            where slope is the change in share per year.
+        """
+        start, end = self._rows(start_year, end_year)
+        rows = self.matrix[start:end].astype(np.float64)
+        year_totals = rows.sum(axis=1)
+        present = year_totals > 0
+        if present.sum() < 2:
+            return [], []
+        shares = rows[present] / year_totals[present, None]
+        x = np.arange(start, end, dtype=np.float64)[present]
+        x -= x.mean()
+        slopes = x @ (shares - shares.mean(axis=0)) / (x @ x)
+
+        candidates = np.flatnonzero(rows.sum(axis=0) >= min_count)
+        order = candidates[np.argsort(-slopes[candidates], kind="stable")]
+        rising = [(self.entities[column], float(slopes[column])) for column in order[:top] if slopes[column] > 0]
+        fading = [(self.entities[column], float(slopes[column])) for column in order[::-1][:top] if slopes[column] < 0]
+        return rising, fading
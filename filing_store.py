@@ -0,0 +1,354 @@
+import os
+import json
+import time
+import hashlib
+import shutil
+import sqlite3
+import threading
+from contextlib import closing
+
+"""
+A persistent, content-addressed store for downloaded 10-K filings. Filings are kept on disk keyed by
+CIK and accession number, each with its raw primary document and the cleaned text produced from it,
+and are described by a SQLite manifest. The store remembers which years have already been
+fetched for a company so that repeated analyses only go to EDGAR for what is missing, and a size and
+age based eviction policy keeps it bounded.
+"""
+
+STORE_DIR = "filing-store"
+MANIFEST_NAME = "manifest.json"
+STORE_DB_NAME = "store.sqlite"
+RAW_NAME = "raw.html"
+CLEANED_NAME = "cleaned.txt"
+SECTIONS_NAME = "sections.json"
+
+# Eviction defaults: keep at most 2 GiB of filings and nothing fetched more than a year ago.
+MAX_STORE_BYTES = 2 * 1024 ** 3
+MAX_AGE_DAYS = 365
+
+
+def accession_year(accession):
+    """
+    Derive the four-digit filing year from an EDGAR accession number (e.g. 0001326801-23-000013).
+
+    Two-digit years up to the current one are taken to be this century. Prefer the filing date from
+    EDGAR where it is known.
+
+    Args:
+        accession (str): The accession number, with dashes.
+
+    Returns:
+        int: The year the accession number was assigned.
+    """
+    year = int(accession.split("-")[1])
+    return year + 2000 if year <= time.localtime().tm_year % 100 else year + 1900
+
+
+def file_sha256(path):
+    """Return the hex SHA-256 digest of a file, read in 1 MiB blocks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_data_manifest(directory):
+    """
+    Read the manifest that ``FilingStore.export`` writes into a per-ticker data folder.
+
+    Returns:
+        list: Manifest entries with ``path`` set to each file's full path, sorted by year, or None
+        if the folder has no manifest.
+    """
+    try:
+        with open(os.path.join(directory, MANIFEST_NAME), 'r', encoding='utf-8') as file:
+            entries = json.load(file)
+    except FileNotFoundError:
+        return None
+    for entry in entries:
+        entry["path"] = os.path.join(directory, entry["file"])
+    return sorted(entries, key=lambda entry: (entry["year"], entry["accession"]))
+
+
+def _link(source, destination):
+    """Hard-link a file into place, falling back to a copy across filesystems."""
+    if os.path.exists(destination):
+        if os.path.samefile(source, destination):
+            return
+        os.remove(destination)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+class FilingStore:
+    """
+    On-disk filing cache laid out as ``{root}/{cik}/{accession}/{raw.html,cleaned.txt}``.
+
+    The manifest is a SQLite database next to the filings. It holds one row per filing (ticker, year,
+    sizes, fetch and access times) and, per CIK, the years that have been checked against EDGAR so empty
+    years are not re-queried. Every change is a transaction on the database, so any number of stores,
+    threads or processes can share one root.
+    """
+
+    def __init__(self, root=STORE_DIR, max_bytes=MAX_STORE_BYTES, max_age_days=MAX_AGE_DAYS):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self._lock = threading.RLock()
+        os.makedirs(self.root, exist_ok=True)
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS filings ("
+                " cik TEXT NOT NULL,"
+                " accession TEXT NOT NULL,"
+                " ticker TEXT NOT NULL,"
+                " year INTEGER NOT NULL,"
+                " raw_bytes INTEGER NOT NULL,"
+                " cleaned_bytes INTEGER NOT NULL,"
+                " sha256 TEXT,"
+                " fetched_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL,"
+                " PRIMARY KEY (cik, accession))"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS checked ("
+                " cik TEXT NOT NULL,"
+                " year INTEGER NOT NULL,"
+                " checked_at REAL NOT NULL,"
+                " PRIMARY KEY (cik, year))"
+            )
+        self._import_json_manifest()
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.root, STORE_DB_NAME)
+
+    def _connect(self):
+        connection = sqlite3.connect(self.manifest_path, timeout=30)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def _import_json_manifest(self):
+        # Stores written before the manifest moved to SQLite kept it in manifest.json; import it once.
+        json_path = os.path.join(self.root, MANIFEST_NAME)
+        try:
+            with open(json_path, 'r', encoding='utf-8') as file:
+                manifest = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        with self._lock, closing(self._connect()) as connection, connection:
+            connection.executemany(
+                "INSERT OR IGNORE INTO filings VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(entry["cik"], entry["accession"], entry["ticker"], entry["year"], entry["raw_bytes"],
+                  entry["cleaned_bytes"], entry.get("sha256"), entry["fetched_at"], entry["accessed_at"])
+                 for entry in manifest.get("filings", {}).values()],
+            )
+            connection.executemany(
+                "INSERT OR IGNORE INTO checked VALUES (?, ?, ?)",
+                [(cik, int(year), checked_at)
+                 for cik, years in manifest.get("checked", {}).items() for year, checked_at in years.items()],
+            )
+        os.replace(json_path, json_path + ".imported")
+
+    def filing_dir(self, cik, accession):
+        return os.path.join(self.root, str(cik), accession)
+
+    def raw_path(self, cik, accession):
+        return os.path.join(self.filing_dir(cik, accession), RAW_NAME)
+
+    def cleaned_path(self, cik, accession):
+        return os.path.join(self.filing_dir(cik, accession), CLEANED_NAME)
+
+    def sections_path(self, cik, accession):
+        return os.path.join(self.filing_dir(cik, accession), SECTIONS_NAME)
+
+    def has(self, cik, accession):
+        with self._lock, closing(self._connect()) as connection:
+            return connection.execute(
+                "SELECT 1 FROM filings WHERE cik = ? AND accession = ?", (str(cik), accession)
+            ).fetchone() is not None
+
+    def filings(self, cik=None, start_year=None, end_year=None):
+        """
+        List the manifest entries stored for a CIK (or for every CIK), optionally restricted to a year range.
+
+        Returns:
+            list: Manifest entries (dicts) sorted by year and accession number.
+        """
+        clauses, params = [], []
+        for clause, value in (("cik = ?", None if cik is None else str(cik)), ("year >= ?", start_year),
+                              ("year <= ?", end_year)):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock, closing(self._connect()) as connection:
+            rows = connection.execute(f"SELECT * FROM filings{where} ORDER BY year, accession", params)
+            return [dict(row) for row in rows]
+
+    def missing_years(self, cik, start_year, end_year):
+        """
+        Work out which years in a range still need to be fetched from EDGAR.
+
+        A year is considered present if a filing for it is stored, or if it was checked before and is
+        not the current calendar year (a company may still file a 10-K later this year).
+
+        Returns:
+            list: The years that must be downloaded, in ascending order.
+        """
+        this_year = time.localtime().tm_year
+        with self._lock, closing(self._connect()) as connection:
+            stored = {row[0] for row in connection.execute("SELECT year FROM filings WHERE cik = ?", (str(cik),))}
+            checked = {row[0] for row in connection.execute("SELECT year FROM checked WHERE cik = ?", (str(cik),))}
+        return [
+            year for year in range(start_year, end_year + 1)
+            if year not in stored and (year not in checked or year >= this_year)
+        ]
+
+    def mark_checked(self, cik, years):
+        """Record that the given years have been queried from EDGAR for a CIK."""
+        now = time.time()
+        with self._lock, closing(self._connect()) as connection, connection:
+            connection.executemany("INSERT OR REPLACE INTO checked VALUES (?, ?, ?)",
+                                   [(str(cik), int(year), now) for year in years])
+
+    def put_raw(self, cik, accession, raw_path):
+        """
+        Move a downloaded primary document into the store.
+
+        Returns:
+            str: The filing's raw path inside the store; its cleaned text belongs at ``cleaned_path``.
+        """
+        os.makedirs(self.filing_dir(cik, accession), exist_ok=True)
+        shutil.move(raw_path, self.raw_path(cik, accession))
+        return self.raw_path(cik, accession)
+
+    def add(self, cik, ticker, accession, year=None):
+        """
+        Record a filing whose raw and cleaned files are already in place in the manifest.
+
+        Args:
+            cik (str or int): The company's CIK number.
+            ticker (str): The ticker symbol the filing was downloaded for.
+            accession (str): The filing's accession number.
+            year (int): The year the filing was filed; derived from the accession number when None.
+
+        Returns:
+            dict: The manifest entry for the stored filing.
+        """
+        now = time.time()
+        entry = {
+            "cik": str(cik),
+            "accession": accession,
+            "ticker": ticker,
+            "year": year if year is not None else accession_year(accession),
+            "raw_bytes": os.path.getsize(self.raw_path(cik, accession)),
+            "cleaned_bytes": os.path.getsize(self.cleaned_path(cik, accession)),
+            "sha256": file_sha256(self.cleaned_path(cik, accession)),
+            "fetched_at": now,
+            "accessed_at": now,
+        }
+        with self._lock, closing(self._connect()) as connection, connection:
+            connection.execute("INSERT OR REPLACE INTO filings VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                               tuple(entry.values()))
+        return entry
+
+    def export(self, cik, start_year, end_year, dest_dir):
+        """
+        Hand the cleaned text of every stored filing in a year range over to a flat folder.
+
+        Files are hard-linked (copied only where the filesystem cannot link) as
+        ``{accession}-{year}_cleaned.txt``, together with ``{accession}-{year}_sections.json`` for filings
+        that have been split into sections. Stale files outside the range are removed, and a
+        ``manifest.json`` listing (ticker, year, accession, bytes, sha256) is written next to them so
+        readers never have to walk the folder.
+
+        Returns:
+            list: The manifest entries written to ``dest_dir``.
+        """
+        os.makedirs(dest_dir, exist_ok=True)
+        entries = self.filings(cik, start_year, end_year)
+        wanted = {f"{entry['accession']}-{entry['year']}_cleaned.txt": entry for entry in entries}
+        sections = {
+            f"{entry['accession']}-{entry['year']}_sections.json": entry for entry in entries
+            if os.path.exists(self.sections_path(cik, entry["accession"]))
+        }
+
+        for file in os.listdir(dest_dir):
+            if file.endswith(("_cleaned.txt", "_sections.json")) and file not in wanted and file not in sections:
+                os.remove(os.path.join(dest_dir, file))
+
+        exported = []
+        for file, entry in sections.items():
+            _link(self.sections_path(cik, entry["accession"]), os.path.join(dest_dir, file))
+        for file, entry in wanted.items():
+            source = self.cleaned_path(cik, entry["accession"])
+            _link(source, os.path.join(dest_dir, file))
+            sections_file = file.replace("_cleaned.txt", "_sections.json")
+            exported.append({
+                "ticker": entry["ticker"],
+                "year": entry["year"],
+                "accession": entry["accession"],
+                "bytes": entry["cleaned_bytes"],
+                "sha256": entry["sha256"] or file_sha256(source),
+                "file": file,
+                "sections": sections_file if sections_file in sections else None,
+            })
+        with self._lock, closing(self._connect()) as connection, connection:
+            connection.executemany(
+                "UPDATE filings SET accessed_at = ?, sha256 = ? WHERE cik = ? AND accession = ?",
+                [(time.time(), entry["sha256"], str(cik), entry["accession"]) for entry in exported],
+            )
+
+        tmp_path = os.path.join(dest_dir, MANIFEST_NAME + ".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(exported, file, indent=1)
+        os.replace(tmp_path, os.path.join(dest_dir, MANIFEST_NAME))
+        return exported
+
+    def size(self):
+        """Return the total number of bytes held by the stored filings."""
+        with self._lock, closing(self._connect()) as connection:
+            return connection.execute("SELECT COALESCE(SUM(raw_bytes + cleaned_bytes), 0) FROM filings").fetchone()[0]
+
+    def remove(self, cik, accession):
+        """Delete a filing from disk and forget it, so its year is fetched again next time."""
+        with self._lock, closing(self._connect()) as connection, connection:
+            row = connection.execute("SELECT year FROM filings WHERE cik = ? AND accession = ?",
+                                     (str(cik), accession)).fetchone()
+            if row is None:
+                return
+            connection.execute("DELETE FROM filings WHERE cik = ? AND accession = ?", (str(cik), accession))
+            connection.execute("DELETE FROM checked WHERE cik = ? AND year = ?", (str(cik), row["year"]))
+        shutil.rmtree(self.filing_dir(cik, accession), ignore_errors=True)
+
+    def evict(self, max_bytes=None, max_age_days=None):
+        """
+        Enforce the store's bounds: drop filings fetched longer ago than ``max_age_days`` and then
+        the least recently accessed filings until the total size fits in ``max_bytes``.
+
+        Returns:
+            list: The ``(cik, accession)`` pairs that were evicted.
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        max_age_days = self.max_age_days if max_age_days is None else max_age_days
+        evicted = []
+        with self._lock:
+            entries = sorted(self.filings(), key=lambda entry: entry["accessed_at"])
+            if max_age_days is not None:
+                cutoff = time.time() - max_age_days * 86400
+                for entry in [entry for entry in entries if entry["fetched_at"] < cutoff]:
+                    evicted.append((entry["cik"], entry["accession"]))
+                    entries.remove(entry)
+            if max_bytes is not None:
+                total = sum(entry["raw_bytes"] + entry["cleaned_bytes"] for entry in entries)
+                while entries and total > max_bytes:
+                    entry = entries.pop(0)
+                    total -= entry["raw_bytes"] + entry["cleaned_bytes"]
+                    evicted.append((entry["cik"], entry["accession"]))
+            for cik, accession in evicted:
+                self.remove(cik, accession)
+        return evicted
@@ -0,0 +1,170 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+
+try:
+    import resource
+except ImportError:  # Windows has no getrusage; peak memory is then reported as 0.
+    resource = None
+
+"""
+Per-stage metrics for the pipeline. Stages such as download, clean, ner, llm and render are wrapped in
+``stage(name)``; each run adds its wall time and whatever the stage reports (bytes processed, documents
+or chunks, cache hits and misses) to a process-wide recorder, together with the process's peak resident
+memory when the stage ended. The totals are exported as JSON, so a run shows which stage dominates and
+benchmarks can compare runs.
+"""
+
+_recorder = None
+_recorder_lock = threading.Lock()
+
+
+def peak_rss_mb():
+    """Peak resident set size so far of this process and of its largest child process, in MB."""
+    if resource is None:
+        return 0.0, 0.0
+    # ru_maxrss is in kilobytes on Linux.
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024)
+
+
+@dataclass
+class StageStats:
+    """The totals of every run of one stage."""
+    name: str
+    calls: int = 0
+    # Summed over calls; stages running on several threads at once can add up to more than the wall time.
+    seconds: float = 0.0
+    max_seconds: float = 0.0
+    bytes: int = 0
+    items: int = 0
+    cache_hits: int = 0
+    cache_misses: int = 0
+    errors: int = 0
+    peak_rss_mb: float = 0.0
+    peak_child_rss_mb: float = 0.0
+    # How far runs of this stage raised the process's peak memory.
+    rss_growth_mb: float = 0.0
+
+
+class Span:
+    """The counters of one run of a stage; ``add`` to them while the stage runs."""
+
+    def __init__(self):
+        self.bytes = 0
+        self.items = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def add(self, bytes=0, items=0, cache_hits=0, cache_misses=0):
+        self.bytes += bytes
+        self.items += items
+        self.cache_hits += cache_hits
+        self.cache_misses += cache_misses
+
+
+class Recorder:
+    """Thread-safe totals per stage name."""
+
+    def __init__(self):
+        self._stages = {}
+        self._lock = threading.Lock()
+        self._started = time.time()
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Time a block as one run of a stage.
+
+        Yields:
+            Span: Counters to fill in while the stage runs; they are added to the stage's totals on exit,
+            also when the block raises.
+        """
+        span = Span()
+        rss_before, _ = peak_rss_mb()
+        start = time.perf_counter()
+        failed = False
+        try:
+            yield span
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            rss, child_rss = peak_rss_mb()
+            with self._lock:
+                stats = self._stages.setdefault(name, StageStats(name))
+                stats.calls += 1
+                stats.seconds += seconds
+                stats.max_seconds = max(stats.max_seconds, seconds)
+                stats.bytes += span.bytes
+                stats.items += span.items
+                stats.cache_hits += span.cache_hits
+                stats.cache_misses += span.cache_misses
+                stats.errors += failed
+                stats.peak_rss_mb = max(stats.peak_rss_mb, rss)
+                stats.peak_child_rss_mb = max(stats.peak_child_rss_mb, child_rss)
+                stats.rss_growth_mb += rss - rss_before
+
+    def snapshot(self):
+        """
+        Return the totals so far.
+
+        Returns:
+            dict: ``started`` (a Unix timestamp), the process's peak memory, and ``stages``, mapping each
+            stage name to its StageStats as a dict, in the order the stages first ran.
+        """
+        rss, child_rss = peak_rss_mb()
+        with self._lock:
+            stages = {name: asdict(stats) for name, stats in self._stages.items()}
+        for stats in stages.values():
+            for key in ("seconds", "max_seconds", "peak_rss_mb", "peak_child_rss_mb", "rss_growth_mb"):
+                stats[key] = round(stats[key], 4)
+        return {"started": self._started, "peak_rss_mb": round(rss, 1), "peak_child_rss_mb": round(child_rss, 1),
+                "stages": stages}
+
+    def reset(self):
+        """Forget every stage, e.g. between benchmark runs."""
+        with self._lock:
+            self._stages = {}
+            self._started = time.time()
+
+    def export(self, path):
+        """Write the snapshot to a JSON file, atomically, and return it."""
+        snapshot = self.snapshot()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(snapshot, file, indent=1)
+        os.replace(tmp_path, path)
+        return snapshot
+
+
+def get_recorder():
+    """Return the process-wide recorder, creating it on first use."""
+    global _recorder
+    if _recorder is None:
+        with _recorder_lock:
+            if _recorder is None:
+                _recorder = Recorder()
+    return _recorder
+
+
+def stage(name):
+    """Time a block as one run of a stage on the process-wide recorder, see Recorder.stage."""
+    return get_recorder().stage(name)
+
+
+def snapshot():
+    return get_recorder().snapshot()
+
+
+def reset():
+    get_recorder().reset()
+
+
+def export(path):
+    return get_recorder().export(path)
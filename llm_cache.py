@@ -0,0 +1,75 @@
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from contextlib import closing
+
+"""
+A persistent cache of LLM responses. Chat completions are stored in SQLite keyed by a hash of the model
+name and the full message list, and expire after a configurable time to live, so the same prompt for
+the same ticker is not paid for again on every run.
+"""
+
+LLM_CACHE_PATH = "llm-cache.sqlite"
+# Responses older than this are treated as missing and requested again.
+LLM_CACHE_TTL = 7 * 24 * 3600
+
+
+def prompt_key(model, messages, **params):
+    """Return a stable SHA-256 key for a chat request: the model, its messages and any sampling parameters."""
+    payload = json.dumps({"model": model, "messages": messages, "params": params}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    SQLite-backed map of ``prompt_key -> response text`` with a time to live.
+
+    Args:
+        path (str): Location of the SQLite database file.
+        ttl (float): Seconds a response stays valid; None keeps responses forever.
+    """
+
+    def __init__(self, path=LLM_CACHE_PATH, ttl=LLM_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " model TEXT NOT NULL,"
+                " response TEXT NOT NULL,"
+                " created_at REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, key):
+        """Return the cached response for a key, or None if it is missing or has expired."""
+        with self._lock, closing(self._connect()) as connection:
+            row = connection.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        response, created_at = row
+        if self.ttl is not None and time.time() - created_at > self.ttl:
+            return None
+        return response
+
+    def put(self, key, model, response):
+        """Store a response under a key, replacing any previous one."""
+        with self._lock, closing(self._connect()) as connection, connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)", (key, model, response, time.time())
+            )
+
+    def purge_expired(self):
+        """Delete every expired response and return how many were removed."""
+        if self.ttl is None:
+            return 0
+        with self._lock, closing(self._connect()) as connection, connection:
+            return connection.execute(
+                "DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl,)
+            ).rowcount
@@ -1,7 +1,7 @@
-from downloader import get_files
+from downloader import data_dir, get_files
 from visualisation import get_vis
 
-def generate_vis(ticker, start_year, current_year):
+def generate_vis(ticker, start_year, current_year, root_dir=".", store=None, scheduler=None):
     """
     Orchestrates the process of downloading files related to a specific ticker and 
     generating a visualization based on the content of these files.
@@ -10,9 +10,16 @@ def generate_vis(ticker, start_year, current_year):
         ticker (str): The ticker symbol of the company for which to generate visual content.
         start_year (int): The starting year of the period for which the files are to be downloaded.
         current_year (int): The ending year of the period for which the files are to be downloaded.
+        root_dir (str): Working directory for the downloads and the data folder. Concurrent calls need
+            separate directories; they share one filing store and one rate-limited EDGAR scheduler, and
+            calls for the same company take turns fetching its filings. Many tickers at once are better
+            served by batch.BatchEngine.
+        store (FilingStore): The filing store; defaults to the one shared by the process.
+        scheduler (DownloadScheduler): The EDGAR scheduler; defaults to the one shared by the process.
 
     Returns:
-        str: The textual response associated with the generated visualization.
+        tuple: The textual response associated with the generated visualization, and the visualization
+        itself as a PNG in an in-memory buffer.
 
     Description:
     This function integrates two major components: file downloading and visualization generation. 
@@ -37,8 +44,10 @@ def generate_vis(ticker, start_year, current_year):
     insights into trends, focuses, or shifts in business strategy or regulatory response.
     """
     # Download files for the specified ticker and year range.
-    get_files(ticker=ticker, start_year=start_year, current_year=current_year)
+    get_files(ticker=ticker, start_year=start_year, current_year=current_year, store=store, root_dir=root_dir,
+              scheduler=scheduler)
 
     # Generate and retrieve the visual representation and textual analysis for the downloaded files.
-    text_response = get_vis(ticker)
-    return text_response
+    text_response, image = get_vis(ticker, directory=data_dir(ticker, root_dir), start_year=start_year,
+                                   end_year=current_year)
+    return text_response, image
@@ -0,0 +1,182 @@
+import os
+import re
+import time
+import pickle
+import hashlib
+
+import numpy as np
+
+"""
+Embedding backends for the RAG model. Every backend exposes the embed_documents / embed_query interface
+of TogetherEmbeddings and returns float32 NumPy arrays. Besides the remote Together model there are
+local CPU backends that need no network access: deterministic feature hashing, TF-IDF with LSA, and any
+sentence-transformers (or ONNX-exported) model loaded from disk.
+"""
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+TOGETHER_MODEL = "togethercomputer/m2-bert-80M-32k-retrieval"
+
+
+class EmbeddingBackend:
+    """
+    Base class for embedding backends.
+
+    Backends with ``requires_fit`` set learn from the corpus (for example a vocabulary) and must be
+    fitted, or loaded from a saved state, before they can embed.
+    """
+
+    name = "base"
+    requires_fit = False
+
+    def fit(self, texts):
+        return self
+
+    def embed_documents(self, texts):
+        raise NotImplementedError
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    def save(self, path):
+        with open(path, 'wb') as file:
+            pickle.dump(self, file)
+
+    @staticmethod
+    def load(path):
+        with open(path, 'rb') as file:
+            return pickle.load(file)
+
+
+class TogetherBackend(EmbeddingBackend):
+    """Remote embeddings from the Together API through langchain's TogetherEmbeddings."""
+
+    name = "together"
+
+    def __init__(self, model=TOGETHER_MODEL):
+        from langchain_together import TogetherEmbeddings
+
+        self.model = TogetherEmbeddings(model=model)
+
+    def embed_documents(self, texts):
+        return np.asarray(self.model.embed_documents(list(texts)), dtype=np.float32)
+
+    def embed_query(self, text):
+        return np.asarray(self.model.embed_query(text), dtype=np.float32)
+
+
+class HashingEmbeddings(EmbeddingBackend):
+    """
+    Deterministic feature-hashing embeddings: every lower-cased word (and word bigram) is hashed to one
+    of ``dim`` signed buckets, and the resulting vector is L2-normalised. The same text always maps to
+    the same vector, which makes the backend suitable for offline benchmarks and tests.
+
+    Args:
+        dim (int): Embedding dimension.
+        latency (float): Seconds to sleep per embed_documents call, to simulate a remote service.
+    """
+
+    name = "hashing"
+
+    def __init__(self, dim=384, latency=0.0):
+        self.dim = dim
+        self.latency = latency
+
+    def _features(self, text):
+        words = TOKEN_PATTERN.findall(text.lower())
+        return words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+
+    def _embed(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in self._features(text):
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dim
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def embed_documents(self, texts):
+        if self.latency:
+            time.sleep(self.latency)
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.stack([self._embed(text) for text in texts])
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+class TfidfEmbeddings(EmbeddingBackend):
+    """
+    TF-IDF over word unigrams and bigrams, reduced to ``dim`` dense dimensions with truncated SVD (LSA)
+    and L2-normalised. Must be fitted on the corpus first.
+    """
+
+    name = "tfidf"
+    requires_fit = True
+
+    def __init__(self, dim=256, max_features=200000):
+        self.dim = dim
+        self.max_features = max_features
+        self.vectorizer = None
+        self.svd = None
+
+    def fit(self, texts):
+        from sklearn.decomposition import TruncatedSVD
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        self.vectorizer = TfidfVectorizer(ngram_range=(1, 2), sublinear_tf=True, max_features=self.max_features)
+        matrix = self.vectorizer.fit_transform(texts)
+        components = max(1, min(self.dim, matrix.shape[1] - 1, matrix.shape[0] - 1))
+        self.svd = TruncatedSVD(n_components=components, random_state=0).fit(matrix)
+        return self
+
+    def embed_documents(self, texts):
+        if self.vectorizer is None:
+            raise RuntimeError("TfidfEmbeddings must be fitted before embedding")
+        vectors = self.svd.transform(self.vectorizer.transform(texts)).astype(np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+
+class SentenceTransformerEmbeddings(EmbeddingBackend):
+    """
+    A small transformer embedding model loaded from a local directory with sentence-transformers,
+    e.g. an all-MiniLM-L6-v2 checkout. Pass ``backend="onnx"`` to run an ONNX export of the model.
+    """
+
+    name = "sentence-transformers"
+
+    def __init__(self, model_path, device="cpu", batch_size=64, backend=None):
+        from sentence_transformers import SentenceTransformer
+
+        options = {"backend": backend} if backend else {}
+        self.model = SentenceTransformer(model_path, device=device, **options)
+        self.batch_size = batch_size
+
+    def embed_documents(self, texts):
+        return self.model.encode(list(texts), batch_size=self.batch_size, normalize_embeddings=True,
+                                 convert_to_numpy=True).astype(np.float32)
+
+    # A loaded torch/ONNX model cannot be pickled; saving is only meaningful for fitted backends.
+    def save(self, path):
+        pass
+
+
+BACKENDS = {
+    backend.name: backend
+    for backend in (TogetherBackend, HashingEmbeddings, TfidfEmbeddings, SentenceTransformerEmbeddings)
+}
+
+
+def get_backend(name, **kwargs):
+    """
+    Create an embedding backend by name: "together", "hashing", "tfidf" or "sentence-transformers".
+
+    The sentence-transformers backend reads its model directory from ``model_path`` or, failing that,
+    the LOCAL_EMBEDDING_MODEL environment variable.
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend {name!r}, expected one of {sorted(BACKENDS)}")
+    if name == "sentence-transformers" and "model_path" not in kwargs:
+        kwargs["model_path"] = os.environ["LOCAL_EMBEDDING_MODEL"]
+    return BACKENDS[name](**kwargs)
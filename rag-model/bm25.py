@@ -0,0 +1,92 @@
+import re
+import math
+from collections import Counter, defaultdict
+
+import numpy as np
+
+"""
+Okapi BM25 over filing chunks. The inverted index maps every term to a posting list of (chunk position,
+BM25 weight) arrays; the weights depend only on the corpus, so they are computed once at build time and
+scoring a query is a scatter-add over the postings of its terms.
+"""
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOP_WORDS = frozenset(
+    "a an and are as at be by did does do for from has have in is it its of on or our over that the their "
+    "this to was were what when where which who whom why with we us how".split()
+)
+
+
+def tokenize(text):
+    """Lower-case word tokens with stop words removed."""
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOP_WORDS]
+
+
+class BM25Index:
+    """
+    Inverted BM25 index over a list of texts.
+
+    Args:
+        texts (list): The documents; results refer to them by position.
+        k1 (float): Term-frequency saturation.
+        b (float): Document-length normalisation.
+    """
+
+    def __init__(self, texts, k1=1.5, b=0.75):
+        self.size = len(texts)
+        postings = defaultdict(lambda: ([], []))
+        lengths = np.zeros(self.size, dtype=np.float32)
+        for position, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            lengths[position] = sum(counts.values())
+            for term, count in counts.items():
+                positions, frequencies = postings[term]
+                positions.append(position)
+                frequencies.append(count)
+
+        average_length = float(lengths.mean()) if self.size else 0.0
+        self.postings = {}
+        for term, (positions, frequencies) in postings.items():
+            positions = np.array(positions, dtype=np.int64)
+            frequencies = np.array(frequencies, dtype=np.float32)
+            idf = math.log(1 + (self.size - len(positions) + 0.5) / (len(positions) + 0.5))
+            norm = k1 * (1 - b + b * lengths[positions] / average_length)
+            self.postings[term] = (positions, (idf * frequencies * (k1 + 1) / (frequencies + norm)).astype(np.float32))
+
+    def __len__(self):
+        return self.size
+
+    def scores(self, query):
+        """Return the BM25 score of every document for a query, as a dense float32 array."""
+        scores = np.zeros(self.size, dtype=np.float32)
+        for term in set(tokenize(query)):
+            if term in self.postings:
+                positions, weights = self.postings[term]
+                scores[positions] += weights
+        return scores
+
+    def search(self, query, k=4, candidates=None):
+        """
+        Find the k best-matching documents.
+
+        Args:
+            query (str): The query text.
+            k (int): The number of documents to return.
+            candidates (array-like): Optionally restrict the search to these document positions.
+
+        Returns:
+            list: ``(position, score)`` tuples, best first; documents sharing no term with the query are
+            left out.
+        """
+        scores = self.scores(query)
+        if candidates is not None:
+            candidates = np.asarray(candidates, dtype=np.int64)
+            masked = np.zeros_like(scores)
+            masked[candidates] = scores[candidates]
+            scores = masked
+        k = min(k, int(np.count_nonzero(scores)))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(position), float(scores[position])) for position in top]
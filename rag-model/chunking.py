@@ -0,0 +1,113 @@
+import os
+import re
+import json
+
+from langchain_core.documents import Document
+
+"""
+Structure-aware chunking of 10-K filings. Filings exported with a ``_sections.json`` file are chunked
+within their Items (Item 1 Business, Item 1A Risk Factors, Item 7 MD&A, ...): paragraphs are packed
+into chunks up to a size limit and never straddle two sections, and every chunk carries the ticker,
+year, accession and section it came from so retrieval can be restricted to, say, the risk factors of
+recent years.
+"""
+
+# Section-aligned chunks need no overlap to keep context, so they can be larger than the old 512-character
+# windows while still producing fewer chunks to embed.
+SECTION_CHUNK_CHARS = 1500
+PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def split_paragraph(paragraph, chunk_chars=SECTION_CHUNK_CHARS):
+    """Split a paragraph longer than chunk_chars at sentence boundaries (or hard, for a run-on sentence)."""
+    if len(paragraph) <= chunk_chars:
+        return [paragraph]
+    pieces, current = [], ""
+    for sentence in SENTENCE_END.split(paragraph):
+        while len(sentence) > chunk_chars:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(sentence[:chunk_chars])
+            sentence = sentence[chunk_chars:]
+        if current and len(current) + 1 + len(sentence) > chunk_chars:
+            pieces.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def pack_paragraphs(text, chunk_chars=SECTION_CHUNK_CHARS):
+    """
+    Pack the paragraphs of a section into chunks of at most chunk_chars characters.
+
+    Returns:
+        list: The chunk texts, in order.
+    """
+    chunks, current = [], ""
+    for paragraph in PARAGRAPH_BREAK.split(text):
+        for piece in split_paragraph(paragraph.strip(), chunk_chars):
+            if not piece:
+                continue
+            if current and len(current) + 2 + len(piece) > chunk_chars:
+                chunks.append(current)
+                current = piece
+            else:
+                current = f"{current}\n\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def read_manifest(data_path):
+    """Return the entries of a data folder's manifest.json, or None if it has none."""
+    path = os.path.join(data_path, "manifest.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+def load_section_chunks(data_path, sections=None, years=None, chunk_chars=SECTION_CHUNK_CHARS):
+    """
+    Chunk the sectioned filings of an exported data folder.
+
+    Args:
+        data_path (str): A ``data-{ticker}`` folder written by FilingStore.export.
+        sections (list): Only keep these Items, e.g. ``["Item 1A", "Item 7"]``; all when None.
+        years (list): Only keep filings from these years; all when None.
+        chunk_chars (int): Maximum characters per chunk.
+
+    Returns:
+        tuple: The list of chunk Documents and the manifest entries (in the year range) that have no
+        sections file and need to be chunked some other way.
+    """
+    chunks, unsectioned = [], []
+    for entry in read_manifest(data_path) or []:
+        if years is not None and entry["year"] not in years:
+            continue
+        if not entry.get("sections"):
+            unsectioned.append(entry)
+            continue
+        with open(os.path.join(data_path, entry["sections"]), 'r', encoding='utf-8') as file:
+            filing_sections = json.load(file)
+        for section in filing_sections:
+            if sections is not None and section["item"] not in sections:
+                continue
+            metadata = {
+                "ticker": entry["ticker"],
+                "year": entry["year"],
+                "accession": entry["accession"],
+                "section": section["item"],
+                "title": section["title"],
+                "source": os.path.join(data_path, entry["file"]),
+            }
+            chunks.extend(
+                Document(page_content=text, metadata=dict(metadata))
+                for text in pack_paragraphs(section["text"], chunk_chars)
+            )
+    return chunks, unsectioned
@@ -0,0 +1,145 @@
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+
+"""
+Concurrent, adaptive embedding of many texts. Texts are packed into batches up to a token budget
+rather than a fixed count, several batches are kept in flight at once, batches that fail transiently
+(timeouts, connection errors, 429/5xx) are retried with exponential backoff and split in half if they
+keep failing, and vectors are written straight into a preallocated float32 array or memmap instead of
+Python lists. Any other error is raised at once.
+"""
+
+# Approximate tokens per batch request; the Together embeddings endpoint accepts far more, but smaller
+# requests keep latency and retry cost down.
+BATCH_TOKEN_BUDGET = 8000
+MAX_BATCH_SIZE = 128
+MAX_IN_FLIGHT = 4
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+# Payload Too Large: the batch is split straight away rather than retried.
+TOO_LARGE_STATUS = 413
+
+
+def estimate_tokens(text):
+    """Cheap token estimate for batching: about four characters per token."""
+    return len(text) // 4 + 1
+
+
+def plan_batches(texts, token_budget=BATCH_TOKEN_BUDGET, max_batch_size=MAX_BATCH_SIZE):
+    """
+    Split texts into consecutive batches that each stay within a token budget and a size limit.
+
+    Returns:
+        list: ``(start, end)`` index ranges, one per batch.
+    """
+    batches, start, tokens = [], 0, 0
+    for position, text in enumerate(texts):
+        cost = estimate_tokens(text)
+        if position > start and (tokens + cost > token_budget or position - start >= max_batch_size):
+            batches.append((start, position))
+            start, tokens = position, 0
+        tokens += cost
+    if start < len(texts):
+        batches.append((start, len(texts)))
+    return batches
+
+
+def error_status(error):
+    """Return the HTTP status of a failed request's exception, as set by requests, httpx or openai, or None."""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+
+def is_transient(error):
+    """
+    Tell whether a failed embedding request is worth retrying: timeouts, connection errors and 429/5xx
+    responses are; bad credentials, bad input or an unfitted backend are not.
+    """
+    status = error_status(error)
+    if status is not None:
+        return status in RETRY_STATUSES
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    # The client libraries' own timeout and connection errors, e.g. requests' ConnectionError or
+    # httpx's ConnectTimeout, do not share a base class with the built-in ones.
+    name = type(error).__name__
+    return "Timeout" in name or "Connect" in name
+
+
+def embed_texts(texts, embeddings, max_in_flight=MAX_IN_FLIGHT, token_budget=BATCH_TOKEN_BUDGET,
+                max_batch_size=MAX_BATCH_SIZE, max_retries=4, backoff=1.0, memmap_path=None, verbose=True):
+    """
+    Embed texts with a backend exposing ``embed_documents``.
+
+    Args:
+        texts (list): The texts to embed.
+        embeddings (object): The embedding backend.
+        max_in_flight (int): Maximum number of concurrent batch requests.
+        token_budget (int): Approximate token budget per batch.
+        max_batch_size (int): Maximum number of texts per batch.
+        max_retries (int): Retries per batch before it is split in half.
+        backoff (float): Base delay in seconds for exponential backoff between retries.
+        memmap_path (str): If given, vectors are written to a float32 memmap at this path.
+        verbose (bool): Print progress and a throughput summary.
+
+    Returns:
+        numpy.ndarray: A ``(len(texts), dim)`` float32 array (or memmap), row i embedding texts[i].
+    """
+    started = time.perf_counter()
+    batches = plan_batches(texts, token_budget, max_batch_size)
+    if not batches:
+        return np.zeros((0, 0), dtype=np.float32)
+
+    def embed_range(start, end):
+        for attempt in range(max_retries + 1):
+            try:
+                return np.asarray(embeddings.embed_documents(texts[start:end]), dtype=np.float32)
+            except Exception as e:
+                too_large = error_status(e) == TOO_LARGE_STATUS
+                if not (too_large or is_transient(e)):
+                    raise
+                if too_large or attempt == max_retries:
+                    if end - start == 1:
+                        raise
+                    # A batch that keeps failing may be too large for the service: split it in half.
+                    middle = (start + end) // 2
+                    return np.concatenate([embed_range(start, middle), embed_range(middle, end)])
+                time.sleep(backoff * 2 ** attempt + random.uniform(0, backoff))
+
+    # The first batch tells us the embedding dimension, so the output can be allocated up front.
+    first = embed_range(*batches[0])
+    shape = (len(texts), first.shape[1])
+    if memmap_path:
+        vectors = np.lib.format.open_memmap(memmap_path, mode="w+", dtype=np.float32, shape=shape)
+    else:
+        vectors = np.empty(shape, dtype=np.float32)
+    vectors[batches[0][0]:batches[0][1]] = first
+
+    done = [1]
+    lock = threading.Lock()
+
+    def run(start, end):
+        vectors[start:end] = embed_range(start, end)
+        with lock:
+            done[0] += 1
+            if verbose:
+                progress = done[0] / len(batches) * 100
+                print(f"Processed batch {done[0]}/{len(batches)} ({progress:.2f}% complete)")
+
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        for future in as_completed([executor.submit(run, start, end) for start, end in batches[1:]]):
+            future.result()
+
+    if memmap_path:
+        vectors.flush()
+    if verbose:
+        seconds = time.perf_counter() - started
+        tokens = sum(estimate_tokens(text) for text in texts)
+        print(f"Embedded {len(texts)} chunks in {len(batches)} batches in {seconds:.2f}s "
+              f"({len(texts) / seconds:.1f} chunks/s, ~{tokens / seconds:.0f} tokens/s)")
+    return vectors
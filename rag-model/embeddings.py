@@ -1,73 +1,144 @@
 import os
-from langchain.document_loaders import DirectoryLoader
+import sys
+from langchain.document_loaders import DirectoryLoader, TextLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_community.vectorstores import FAISS
 from langchain_core.output_parsers import StrOutputParser
-from langchain_together import TogetherEmbeddings
+from langchain_core.runnables import RunnableLambda, RunnablePassthrough
 from langchain_community.llms import Together
+from vector_index import VectorIndex
+from chunking import load_section_chunks, read_manifest
+from hybrid import HybridRetriever, format_context
+from backends import get_backend
+from embedding_pipeline import BATCH_TOKEN_BUDGET, MAX_IN_FLIGHT, embed_texts
+
+# Stage metrics are recorded with the analyser's instrumentation module, one directory up.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from instrumentation import export, stage
 
 # Define the path constants for the directory locations.
-CHROMA_PATH = "chroma"
 DATA_PATH = "data-META"
+INDEX_PATH = os.path.join("vector-index", os.path.basename(DATA_PATH))
+METRICS_PATH = "rag-metrics.json"
+# "together" (remote) or a local CPU backend: "hashing", "tfidf" or "sentence-transformers".
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "together")
 os.environ["TOGETHER_API_KEY"] = ""
 # Optionally set the LangChain API key from an environment variable or prompt.
 # os.environ["LANGCHAIN_API_KEY"] = getpass.getpass("Enter LangChain API Key: ")
 
-def load_and_split_documents():
+def load_and_split_documents(data_path=DATA_PATH, sections=None, years=None):
     """
     Load text documents from a specified directory and split them into smaller chunks.
 
+    Filings exported with sections are chunked within their Items and tagged with ticker, year,
+    accession and section metadata; other filings fall back to fixed-size overlapping windows.
+
+    Args:
+        data_path (str): The exported data folder.
+        sections (list): Only keep these Items, e.g. ``["Item 1A"]``. Filings without sections are
+            skipped when this is given.
+        years (list): Only keep filings from these years.
+
     Returns:
         list: A list of document chunks, each within the specified size constraints.
     """
-    # Load all text files from the specified data path.
-    loader = DirectoryLoader(DATA_PATH, glob="*.txt")
-    documents = loader.load()
-
     # Split documents into chunks of 512 characters with 128 characters overlap.
     text_splitter = RecursiveCharacterTextSplitter(chunk_size=512, chunk_overlap=128)
-    chunks = text_splitter.split_documents(documents)
+
+    with stage("chunk") as span:
+        if read_manifest(data_path) is None:
+            # Load all text files from the specified data path.
+            loader = DirectoryLoader(data_path, glob="*.txt")
+            chunks = text_splitter.split_documents(loader.load())
+        else:
+            chunks, unsectioned = load_section_chunks(data_path, sections=sections, years=years)
+            if sections is None:
+                for entry in unsectioned:
+                    documents = TextLoader(os.path.join(data_path, entry["file"]), encoding="utf-8").load()
+                    for document in documents:
+                        document.metadata.update(ticker=entry["ticker"], year=entry["year"],
+                                                 accession=entry["accession"])
+                    chunks.extend(text_splitter.split_documents(documents))
+        span.add(bytes=sum(len(chunk.page_content.encode("utf-8")) for chunk in chunks), items=len(chunks))
     return chunks
 
-def create_embeddings(chunks, batch_size=10):
+def get_embeddings(backend=EMBEDDING_BACKEND):
+    """
+    Return the embedding backend used for both documents and queries.
+
+    Args:
+        backend (str): The name of the backend, see backends.get_backend.
+    """
+    return get_backend(backend)
+
+def create_embeddings(chunks, embeddings=None, max_in_flight=MAX_IN_FLIGHT, token_budget=BATCH_TOKEN_BUDGET,
+                      memmap_path=None):
     """
     Create embeddings for each chunk of text using a pre-trained model and track the progress.
 
+    Chunks are packed into batches up to a token budget, up to max_in_flight batches are embedded
+    concurrently with retries, and the vectors are written into a preallocated float32 array.
+
     Args:
         chunks (list): A list of document chunks.
-        batch_size (int): The number of chunks to process at one time.
+        embeddings (object): The embedding backend; defaults to EMBEDDING_BACKEND.
+        max_in_flight (int): The number of batches embedded concurrently.
+        token_budget (int): The approximate number of tokens per batch.
+        memmap_path (str): Optionally write the vectors to a memory-mapped .npy file at this path.
 
     Returns:
-        list: A list of embeddings corresponding to the document chunks.
+        numpy.ndarray: A (number of chunks, dimension) float32 array of embeddings.
     """
-    embeddings = TogetherEmbeddings(model="togethercomputer/m2-bert-80M-32k-retrieval")
-    all_embeddings = []
-    total_batches = (len(chunks) + batch_size - 1) // batch_size
-
-    for i in range(0, len(chunks), batch_size):
-        batch_chunks = chunks[i:i+batch_size]
-        texts = [chunk.page_content for chunk in batch_chunks]
-        batch_embeddings = embeddings.embed_documents(texts)
-        all_embeddings.extend(batch_embeddings)
-        progress = (i // batch_size + 1) / total_batches * 100
-        print(f"Processed batch {i//batch_size + 1}/{total_batches} ({progress:.2f}% complete)")
-
-    return all_embeddings
+    return embed_texts(
+        [chunk.page_content for chunk in chunks],
+        embeddings or get_embeddings(),
+        max_in_flight=max_in_flight,
+        token_budget=token_budget,
+        memmap_path=memmap_path,
+    )
 
-def setup_vector_store(texts, embeddings):
+def setup_vector_store(chunks, index_path=INDEX_PATH, backend=EMBEDDING_BACKEND, where=None):
     """
-    Initialize a FAISS vector store with texts and their corresponding embeddings.
+    Load the persistent vector index and bring it up to date with the given chunks.
+
+    Only chunks whose content the index has not seen are embedded; chunks that are no longer present are
+    deleted. The updated index is saved back to disk. Each backend keeps its own index, and backends
+    that learn from the corpus are fitted once and saved alongside it.
 
     Args:
-        texts (list): A list of document texts.
-        embeddings (list): A list of embeddings for the texts.
+        chunks (list): A list of document chunks.
+        index_path (str): Directory of the persistent index.
+        backend (str): The name of the embedding backend.
+        where (dict): Optional metadata filter applied to every query, e.g. ``{"section": "Item 1A"}``.
 
     Returns:
-        object: A retriever object capable of handling queries based on the embeddings.
+        HybridRetriever: A BM25 + vector retriever over the index.
     """
-    vectorstore = FAISS.from_texts(texts, embeddings)
-    return vectorstore.as_retriever()
+    index_path = os.path.join(index_path, backend)
+    with stage("embed") as span:
+        index = VectorIndex(index_path)
+        embeddings = get_embeddings(backend)
+        if embeddings.requires_fit:
+            state_path = os.path.join(index_path, "backend.pkl")
+            if os.path.exists(state_path) and len(index):
+                embeddings = embeddings.load(state_path)
+            else:
+                embeddings.fit([chunk.page_content for chunk in chunks])
+                embeddings.save(state_path)
+
+        by_text = {chunk.page_content: chunk for chunk in chunks}
+
+        def embed(texts):
+            span.add(bytes=sum(len(text.encode("utf-8")) for text in texts), items=len(texts))
+            return create_embeddings([by_text[text] for text in texts], embeddings)
+
+        added, embedded, deleted = index.sync([chunk.page_content for chunk in chunks],
+                                              [chunk.metadata for chunk in chunks], embed)
+        # Texts the index already held a vector for are the cache hits of this stage.
+        span.add(cache_hits=len(by_text) - embedded, cache_misses=embedded)
+        index.save()
+    print(f"Vector index: {added} chunks added ({embedded} embedded), {deleted} removed, {len(index)} total")
+    return HybridRetriever(index, embeddings, where=where)
 
 def setup_query_interface(retriever):
     """
@@ -77,7 +148,7 @@ def setup_query_interface(retriever):
         retriever (object): A retriever object containing document embeddings.
 
     Returns:
-        object: A pipeline object configured for responding to queries about the documents.
+        object: A pipeline object that takes a question, retrieves its context and answers it.
     """
     model = Together(
         model="mistralai/Mixtral-8x7B-Instruct-v0.1",
@@ -88,21 +159,34 @@ def setup_query_interface(retriever):
     prompt = ChatPromptTemplate.from_template(
         "<s>[INST] Answer the question in a simple sentence based only on the following context:\n{context}\n\nQuestion: {question} [/INST]"
     )
-    return prompt | model | StrOutputParser()
+
+    def retrieve(question):
+        with stage("retrieve") as span:
+            hits = retriever.cache_hits
+            passages = retriever.retrieve(question)
+            hit = retriever.cache_hits - hits
+            span.add(items=len(passages), cache_hits=hit, cache_misses=1 - hit)
+        return format_context(passages)
+
+    context = RunnableLambda(retrieve)
+    return {"context": context, "question": RunnablePassthrough()} | prompt | model | StrOutputParser()
 
 def main():
     """
     The main function to load documents, create embeddings, and set up a query interface.
     """
     chunks = load_and_split_documents()
-    texts = [chunk.page_content for chunk in chunks]
-    embeddings = create_embeddings(chunks)
-    retriever = setup_vector_store(texts, embeddings)
+    # Risk factors live in Item 1A; restricting the search to it keeps other Items out of the context.
+    if not any(chunk.metadata.get("section") == "Item 1A" for chunk in chunks):
+        raise ValueError(f"{DATA_PATH} has no Item 1A sections; export it again with get_files(..., sections=True)")
+    retriever = setup_vector_store(chunks, where={"section": "Item 1A"})
     chain = setup_query_interface(retriever)
     
     input_query = "Tell me something about the company's risk factors based on these documents over the years."
-    output = chain.invoke({"context": retriever, "question": input_query})
+    with stage("answer"):
+        output = chain.invoke(input_query)
     print(output)
+    export(METRICS_PATH)
 
 if __name__ == "__main__":
     main()
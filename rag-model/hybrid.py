@@ -0,0 +1,151 @@
+import json
+import threading
+from collections import OrderedDict
+
+from bm25 import BM25Index
+from embedding_pipeline import estimate_tokens
+
+"""
+Hybrid retrieval for the RAG model: BM25 keyword search and vector similarity are run over the same
+(optionally metadata-filtered) chunks and fused with reciprocal rank fusion, and the best passages are
+packed into a context token budget. Results are kept in an LRU cache keyed by query and filter, so
+repeated questions skip both the query embedding and the search.
+"""
+
+CONTEXT_TOKEN_BUDGET = 3000
+# Passages each retriever contributes before fusion.
+FUSION_CANDIDATES = 50
+# Reciprocal rank fusion constant: higher values flatten the advantage of the very top ranks.
+RRF_K = 60
+QUERY_CACHE_SIZE = 256
+
+
+def format_context(passages):
+    """Join retrieved passages into a prompt context, each labelled with its year and section."""
+    blocks = []
+    for text, metadata, _ in passages:
+        label = " ".join(str(metadata[key]) for key in ("ticker", "year", "section") if metadata.get(key))
+        blocks.append(f"[{label}]\n{text}" if label else text)
+    return "\n\n".join(blocks)
+
+
+class HybridRetriever:
+    """
+    BM25 + vector retriever over a VectorIndex.
+
+    The BM25 index is built from the chunks in the vector index when the retriever is created, so create
+    the retriever after the vector index has been synced.
+
+    Args:
+        index (VectorIndex): The persistent vector index.
+        embeddings (object): Backend used to embed queries.
+        k (int): Maximum number of passages to return.
+        where (dict): Default metadata filter, e.g. ``{"year": [2022, 2023], "section": "Item 1A"}``.
+        context_tokens (int): Approximate token budget for the returned passages.
+        candidates (int): Passages taken from each of BM25 and vector search before fusion.
+        cache_size (int): Number of queries kept in the LRU cache.
+    """
+
+    def __init__(self, index, embeddings, k=4, where=None, context_tokens=CONTEXT_TOKEN_BUDGET,
+                 candidates=FUSION_CANDIDATES, cache_size=QUERY_CACHE_SIZE):
+        self.index = index
+        self.embeddings = embeddings
+        self.k = k
+        self.where = where
+        self.context_tokens = context_tokens
+        self.candidates = candidates
+        self.cache_size = cache_size
+
+        rows = index.chunks()
+        self.ids = list(rows)
+        self.positions = {id_: position for position, id_ in enumerate(self.ids)}
+        self.texts = [rows[id_][0] for id_ in self.ids]
+        self.metadatas = [rows[id_][1] for id_ in self.ids]
+        self.bm25 = BM25Index(self.texts)
+
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def _cache_key(self, query, where, k):
+        return query, k, json.dumps(where, sort_keys=True, default=list)
+
+    def _matches(self, metadata, where):
+        for key, values in where.items():
+            values = values if isinstance(values, (list, tuple, set)) else [values]
+            if metadata.get(key) not in values:
+                return False
+        return True
+
+    def _fuse(self, query, where, k):
+        candidates = candidate_ids = None
+        if where:
+            # Filter in memory: the retriever already holds every chunk's metadata.
+            candidates = [position for position, metadata in enumerate(self.metadatas) if self._matches(metadata, where)]
+            if not candidates:
+                return []
+            candidate_ids = [self.ids[position] for position in candidates]
+
+        scores = {}
+        keyword_hits = self.bm25.search(query, self.candidates, candidates)
+        for rank, (position, _) in enumerate(keyword_hits):
+            scores[position] = scores.get(position, 0.0) + 1 / (RRF_K + rank + 1)
+        vector_hits = self.index.search_ids(self.embeddings.embed_query(query), self.candidates, ids=candidate_ids)
+        for rank, (id_, _) in enumerate(vector_hits):
+            if id_ in self.positions:
+                position = self.positions[id_]
+                scores[position] = scores.get(position, 0.0) + 1 / (RRF_K + rank + 1)
+
+        passages, tokens, seen = [], 0, set()
+        for position in sorted(scores, key=scores.get, reverse=True):
+            # Boilerplate repeated verbatim across years is indexed once per filing; pass it on only once.
+            if len(passages) == k:
+                break
+            if self.texts[position] in seen:
+                continue
+            seen.add(self.texts[position])
+            cost = estimate_tokens(self.texts[position])
+            if passages and tokens + cost > self.context_tokens:
+                break
+            passages.append((self.texts[position], self.metadatas[position], scores[position]))
+            tokens += cost
+        return passages
+
+    def retrieve(self, query, where=None, k=None):
+        """
+        Return the best passages for a query within the context token budget.
+
+        Args:
+            query (str): The question.
+            where (dict): Metadata filter; defaults to the retriever's own.
+            k (int): Maximum number of passages; defaults to the retriever's own.
+
+        Returns:
+            list: ``(text, metadata, score)`` tuples, best first.
+        """
+        where = where if where is not None else self.where
+        k = k or self.k
+        key = self._cache_key(query, where, k)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.cache_hits += 1
+                return list(self._cache[key])
+            self.cache_misses += 1
+
+        passages = self._fuse(query, where, k)
+        with self._lock:
+            self._cache[key] = passages
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return list(passages)
+
+    def invoke(self, query, where=None):
+        """Return the texts of the best passages for a query."""
+        return [text for text, _, _ in self.retrieve(query, where)]
+
+    def clear_cache(self):
+        with self._lock:
+            self._cache.clear()
@@ -0,0 +1,288 @@
+import os
+import json
+import sqlite3
+import hashlib
+from contextlib import closing
+
+import numpy as np
+
+"""
+A persistent, incremental vector index for filing chunks. Vectors live in a FAISS inner-product index
+(cosine similarity over L2-normalised vectors), and chunk texts and metadata live next to it in SQLite,
+where they are committed as they are added. The index is only written back when it changed. Every chunk
+is keyed by the hash of its content and metadata: a passage repeated verbatim in several filings is kept
+once per filing, so metadata filters find it in each of them, while its text is only embedded once. Only
+texts the index has not seen need embedding, and chunks that disappear from the corpus can be deleted
+without a rebuild.
+"""
+
+# SQLite's default limit on the number of parameters in one statement.
+MAX_PARAMS = 999
+
+INDEX_FILE = "index.faiss"
+CHUNKS_FILE = "chunks.sqlite"
+
+
+def chunk_hash(text, metadata=None):
+    """Return the SHA-256 hex digest of a chunk's text and, if given, its metadata."""
+    digest = hashlib.sha256(text.encode("utf-8"))
+    if metadata:
+        digest.update(b"\0" + json.dumps(metadata, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def chunk_id(content_hash):
+    """Map a content hash to the positive 63-bit integer FAISS uses as the vector id."""
+    return int(content_hash[:16], 16) & 0x7FFFFFFFFFFFFFFF
+
+
+class VectorIndex:
+    """
+    FAISS index plus chunk store, saved under one directory.
+
+    Args:
+        path (str): Directory holding ``index.faiss`` and ``chunks.sqlite``.
+    """
+
+    def __init__(self, path):
+        import faiss
+
+        self.path = path
+        self._faiss = faiss
+        self.index = None
+        self._dirty = False
+        os.makedirs(path, exist_ok=True)
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                " id INTEGER PRIMARY KEY,"
+                " hash TEXT NOT NULL UNIQUE,"
+                " text TEXT NOT NULL,"
+                " metadata TEXT NOT NULL)"
+            )
+        if os.path.exists(self.index_path):
+            self.index = faiss.read_index(self.index_path)
+
+    @property
+    def index_path(self):
+        return os.path.join(self.path, INDEX_FILE)
+
+    def _connect(self):
+        return sqlite3.connect(os.path.join(self.path, CHUNKS_FILE))
+
+    def _writable_index(self, dim):
+        if self.index is None:
+            self.index = self._faiss.IndexIDMap2(self._faiss.IndexFlatIP(dim))
+        self._dirty = True
+        return self.index
+
+    def __len__(self):
+        return 0 if self.index is None else self.index.ntotal
+
+    def hashes(self):
+        """Return the content hashes of every indexed chunk."""
+        with closing(self._connect()) as connection:
+            return {row[0] for row in connection.execute("SELECT hash FROM chunks")}
+
+    def add(self, texts, vectors, metadatas=None):
+        """
+        Add chunks and their embeddings; chunks whose content and metadata are already indexed are skipped.
+
+        Args:
+            texts (list): Chunk texts.
+            vectors (array-like): One embedding per text.
+            metadatas (list): Optional metadata dict per text.
+
+        Returns:
+            int: The number of chunks added.
+        """
+        if not len(texts):
+            return 0
+        metadatas = metadatas or [{} for _ in texts]
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        known = self.hashes()
+
+        rows, keep = [], []
+        for position, (text, metadata) in enumerate(zip(texts, metadatas)):
+            content_hash = chunk_hash(text, metadata)
+            if content_hash in known:
+                continue
+            known.add(content_hash)
+            rows.append((chunk_id(content_hash), content_hash, text, json.dumps(metadata)))
+            keep.append(position)
+        if not rows:
+            return 0
+
+        vectors = vectors[keep].copy()
+        self._faiss.normalize_L2(vectors)
+        index = self._writable_index(vectors.shape[1])
+        index.add_with_ids(vectors, np.array([row[0] for row in rows], dtype=np.int64))
+        with closing(self._connect()) as connection, connection:
+            connection.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def delete(self, content_hashes):
+        """
+        Remove chunks by content hash.
+
+        Returns:
+            int: The number of chunks removed.
+        """
+        ids = [chunk_id(content_hash) for content_hash in content_hashes]
+        if not ids or self.index is None:
+            return 0
+        removed = self._writable_index(self.index.d).remove_ids(np.array(ids, dtype=np.int64))
+        with closing(self._connect()) as connection, connection:
+            connection.executemany("DELETE FROM chunks WHERE id = ?", [(chunk_id_,) for chunk_id_ in ids])
+        return removed
+
+    def vectors_for(self, texts):
+        """
+        Return the stored, normalised vectors of any of the given texts that are already indexed.
+
+        Returns:
+            dict: Maps each indexed text to its vector.
+        """
+        if self.index is None:
+            return {}
+        texts = list(set(texts))
+        ids = {}
+        with closing(self._connect()) as connection:
+            for start in range(0, len(texts), MAX_PARAMS):
+                batch = texts[start:start + MAX_PARAMS]
+                ids.update(connection.execute(
+                    f"SELECT text, id FROM chunks WHERE text IN ({','.join('?' * len(batch))})", batch
+                ))
+        return {text: self.index.reconstruct(id_) for text, id_ in ids.items()}
+
+    def sync(self, texts, metadatas, embed_documents):
+        """
+        Bring the index in line with a corpus: add the chunks it has not seen, and delete indexed chunks
+        that are no longer part of the corpus. Only texts that are not indexed under any metadata are
+        embedded; a text seen before reuses its vector.
+
+        Args:
+            texts (list): The corpus' chunk texts.
+            metadatas (list): Metadata dict per chunk.
+            embed_documents (callable): Maps a list of texts to their embeddings.
+
+        Returns:
+            tuple: The number of chunks added, texts embedded and chunks deleted.
+        """
+        known = self.hashes()
+        wanted = {}
+        for text, metadata in zip(texts, metadatas):
+            wanted.setdefault(chunk_hash(text, metadata), (text, metadata))
+
+        stale = known - wanted.keys()
+        new = [wanted[content_hash] for content_hash in wanted.keys() - known]
+        # Look up reusable vectors before deleting, so a chunk that only changed its metadata keeps its vector.
+        vectors = self.vectors_for([text for text, _ in new]) if new else {}
+        deleted = self.delete(stale)
+        added = embedded = 0
+        if new:
+            missing = list(dict.fromkeys(text for text, _ in new if text not in vectors))
+            if missing:
+                vectors.update(zip(missing, embed_documents(missing)))
+                embedded = len(missing)
+            added = self.add([text for text, _ in new], np.stack([vectors[text] for text, _ in new]),
+                             [metadata for _, metadata in new])
+        return added, embedded, deleted
+
+    def save(self):
+        """Write the FAISS index to disk if it changed; chunk texts are committed as they are added."""
+        if self.index is not None and self._dirty:
+            tmp_path = self.index_path + ".tmp"
+            self._faiss.write_index(self.index, tmp_path)
+            os.replace(tmp_path, self.index_path)
+            self._dirty = False
+
+    def filter_ids(self, where):
+        """
+        Return the ids of the chunks whose metadata matches a filter.
+
+        Args:
+            where (dict): Maps a metadata key to an allowed value or list of values, e.g.
+                ``{"year": [2021, 2022, 2023], "section": "Item 1A"}``.
+        """
+        clauses, params = [], []
+        for key, values in where.items():
+            values = list(values) if isinstance(values, (list, tuple, set)) else [values]
+            clauses.append(f"json_extract(metadata, ?) IN ({','.join('?' * len(values))})")
+            params.extend([f"$.{key}", *values])
+        with closing(self._connect()) as connection:
+            return [row[0] for row in connection.execute(f"SELECT id FROM chunks WHERE {' AND '.join(clauses)}", params)]
+
+    def search_ids(self, query_vector, k=4, where=None, ids=None):
+        """
+        Find the ids of the chunks most similar to a query embedding.
+
+        Args:
+            query_vector (array-like): The query embedding.
+            k (int): The number of chunks to return.
+            where (dict): Optional metadata filter, see filter_ids. Matching chunks are selected in SQLite
+                first and only those are scored.
+            ids (list): Optionally restrict the search to these chunk ids, for callers that have already
+                applied a filter.
+
+        Returns:
+            list: ``(id, score)`` tuples, best first.
+        """
+        if not len(self):
+            return []
+        query = np.ascontiguousarray(query_vector, dtype=np.float32).reshape(1, -1)
+        self._faiss.normalize_L2(query)
+        if where or ids is not None:
+            candidates = self.filter_ids(where) if ids is None else list(ids)
+            if not candidates:
+                return []
+            selector = self._faiss.IDSelectorBatch(np.array(candidates, dtype=np.int64))
+            scores, ids = self.index.search(query, min(k, len(candidates)),
+                                            params=self._faiss.SearchParameters(sel=selector))
+        else:
+            scores, ids = self.index.search(query, min(k, len(self)))
+        return [(int(id_), float(score)) for id_, score in zip(ids[0], scores[0]) if id_ != -1]
+
+    def chunks(self, ids=None):
+        """
+        Return indexed chunks as a dict of id to ``(text, metadata)``: the given ids, or every chunk.
+        """
+        with closing(self._connect()) as connection:
+            if ids is None:
+                rows = connection.execute("SELECT id, text, metadata FROM chunks")
+            else:
+                ids = list(ids)
+                rows = connection.execute(
+                    f"SELECT id, text, metadata FROM chunks WHERE id IN ({','.join('?' * len(ids))})", ids
+                )
+            return {row[0]: (row[1], json.loads(row[2])) for row in rows}
+
+    def search(self, query_vector, k=4, where=None):
+        """
+        Find the chunks most similar to a query embedding.
+
+        Returns:
+            list: ``(text, metadata, score)`` tuples, best first.
+        """
+        hits = self.search_ids(query_vector, k, where)
+        rows = self.chunks([id_ for id_, _ in hits])
+        return [(*rows[id_], score) for id_, score in hits if id_ in rows]
+
+    def as_retriever(self, embeddings, k=4, where=None):
+        """Return a retriever that embeds a query with ``embeddings.embed_query`` and searches this index."""
+        return Retriever(self, embeddings, k, where)
+
+
+class Retriever:
+    """Callable query interface over a VectorIndex."""
+
+    def __init__(self, index, embeddings, k=4, where=None):
+        self.index = index
+        self.embeddings = embeddings
+        self.k = k
+        self.where = where
+
+    def invoke(self, query, where=None):
+        """Return the texts of the ``k`` chunks most similar to the query, optionally filtered by metadata."""
+        where = where if where is not None else self.where
+        return [text for text, _, _ in self.index.search(self.embeddings.embed_query(query), self.k, where)]
@@ -0,0 +1,152 @@
+import re
+import json
+import math
+from functools import lru_cache
+from collections import Counter
+
+"""
+Local ranking of extracted entities before they are sent to the LLM. Entities are normalised and
+deduplicated, scored by frequency weighted with inverse document frequency across filings (TF-IDF),
+and truncated so the JSON payload fits a token budget measured with a real tokenizer (tiktoken), or
+estimated from its length when the tokenizer is unavailable.
+"""
+
+# Default size, in tokens, of the entity payload sent to important_words.
+ENTITY_TOKEN_BUDGET = 4000
+TOKEN_ENCODING = "cl100k_base"
+
+WHITESPACE = re.compile(r"\s+")
+EDGE_PUNCTUATION = "\"'`“”‘’()[]{}.,;:-–—•*"
+
+
+@lru_cache(maxsize=None)
+def _encoding(name):
+    # tiktoken downloads an encoding the first time it is used; without it (or without network access)
+    # token counts fall back to an estimate rather than failing the analysis.
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(name)
+    except Exception as e:
+        print(f"Could not load the {name} token encoding ({e}); estimating tokens as 4 characters each")
+        return None
+
+
+def count_tokens(text, encoding=TOKEN_ENCODING):
+    """
+    Return the number of tokens in a string under the given tiktoken encoding, or an estimate of about
+    four characters per token if the encoding cannot be loaded.
+    """
+    tokenizer = _encoding(encoding)
+    if tokenizer is None:
+        return len(text) // 4 + 1
+    return len(tokenizer.encode(text))
+
+
+def normalise_entity(text):
+    """
+    Clean up an entity's surface form: collapse whitespace, strip surrounding punctuation and a trailing
+    possessive, and drop a leading "the" (spaCy includes it in many LAW entities).
+
+    Returns:
+        str: The cleaned entity, or an empty string if nothing meaningful is left.
+    """
+    text = WHITESPACE.sub(" ", text).strip(EDGE_PUNCTUATION + " ")
+    if text.endswith(("'s", "’s")):
+        text = text[:-2]
+    if text.lower().startswith("the "):
+        text = text[4:]
+    text = text.strip(EDGE_PUNCTUATION + " ")
+    if len(text) < 2 or not any(character.isalpha() for character in text):
+        return ""
+    return text
+
+
+def rank_entities(per_filing_counts):
+    """
+    Merge per-filing entity counts into one deduplicated list ordered by TF-IDF score.
+
+    Variants that normalise to the same case-folded form are merged and shown with their most frequent
+    spelling. The score of an entity is ``(1 + log(tf)) * idf`` with ``idf = log((1 + N) / (1 + df)) + 1``,
+    where tf is its total count, df the number of filings mentioning it and N the number of filings.
+
+    Args:
+        per_filing_counts (list): One ``{entity: count}`` mapping per filing.
+
+    Returns:
+        list: ``(entity, count, score)`` tuples, best first.
+    """
+    totals = Counter()
+    document_frequency = Counter()
+    spellings = {}
+    for counts in per_filing_counts:
+        seen = set()
+        for entity, count in counts.items():
+            surface = normalise_entity(entity)
+            if not surface:
+                continue
+            key = surface.casefold()
+            totals[key] += count
+            spellings.setdefault(key, Counter())[surface] += count
+            seen.add(key)
+        document_frequency.update(seen)
+
+    n_filings = len(per_filing_counts)
+    ranked = []
+    for key, count in totals.items():
+        idf = math.log((1 + n_filings) / (1 + document_frequency[key])) + 1
+        score = (1 + math.log(count)) * idf
+        ranked.append((spellings[key].most_common(1)[0][0], count, score))
+    ranked.sort(key=lambda item: (-item[2], -item[1], item[0]))
+    return ranked
+
+
+def budget_entities(ranked, token_budget=ENTITY_TOKEN_BUDGET, encoding=TOKEN_ENCODING):
+    """
+    Keep the best-ranked entities whose JSON payload fits within a token budget.
+
+    Returns:
+        dict: ``{entity: count}`` for the kept entities, best first.
+    """
+    # Estimate each entry's share of the payload, cut where the running total reaches the budget, then
+    # shrink until the exact count of the serialised payload fits.
+    used, keep = 2, 0
+    for entity, count, _ in ranked:
+        used += count_tokens(f"{json.dumps(entity)}: {count}, ", encoding)
+        if used > token_budget:
+            break
+        keep += 1
+    payload = {entity: count for entity, count, _ in ranked[:keep]}
+    while payload and count_tokens(json.dumps(payload), encoding) > token_budget:
+        keep -= 1
+        payload = {entity: count for entity, count, _ in ranked[:keep]}
+    return payload
+
+
+def prepare_entities(per_filing_counts, token_budget=ENTITY_TOKEN_BUDGET, encoding=TOKEN_ENCODING):
+    """
+    Build the entity payload for important_words and report what the ranking saved.
+
+    Args:
+        per_filing_counts (list): One ``{entity: count}`` mapping per filing.
+        token_budget (int): Maximum number of tokens of the serialised payload.
+        encoding (str): The tiktoken encoding used to count tokens.
+
+    Returns:
+        tuple: The ``{entity: count}`` payload and a dict of statistics (entity and token counts before
+        and after, and tokens saved).
+    """
+    merged = Counter()
+    for counts in per_filing_counts:
+        merged.update(counts)
+    payload = budget_entities(rank_entities(per_filing_counts), token_budget, encoding)
+
+    original_tokens = count_tokens(json.dumps(merged), encoding)
+    payload_tokens = count_tokens(json.dumps(payload), encoding)
+    stats = {
+        "original_entities": len(merged),
+        "kept_entities": len(payload),
+        "original_tokens": original_tokens,
+        "payload_tokens": payload_tokens,
+        "saved_tokens": original_tokens - payload_tokens,
+    }
+    return payload, stats
@@ -0,0 +1,180 @@
+import os
+import re
+import json
+import pickle
+import difflib
+import threading
+from bisect import bisect_left
+
+"""
+Ticker and company lookup over the SEC's company_tickers.json. The JSON file is parsed once into a
+compact index: dicts for constant-time ticker -> CIK and CIK -> tickers lookups, and sorted key arrays
+for prefix search over tickers, company names and the words in them, searched with bisect. The index is
+pickled next to the working directory and rebuilt only when the JSON file's mtime or size changes.
+"""
+
+TICKERS_PATH = os.path.join("assets", "company_tickers.json")
+TICKER_INDEX_PATH = "ticker-index.pickle"
+# Bump when the pickled layout changes, so stale index files are rebuilt rather than misread.
+INDEX_VERSION = 1
+NAME_WORD = re.compile(r"[a-z0-9]+")
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def normalise_ticker(ticker):
+    """Upper-case a ticker and write share classes with a dash, as EDGAR does (``brk.b`` -> ``BRK-B``)."""
+    return ticker.strip().upper().replace(".", "-").replace("/", "-")
+
+
+def normalise_name(name):
+    """Lower-case a company name and reduce it to single-spaced words."""
+    return " ".join(NAME_WORD.findall(name.casefold()))
+
+
+def _prefix_range(keys, prefix):
+    return bisect_left(keys, prefix), bisect_left(keys, prefix + "\uffff")
+
+
+class TickerIndex:
+    """
+    Lookup structures over a list of companies.
+
+    Args:
+        companies (list): ``(ticker, cik, title)`` tuples, as in company_tickers.json.
+    """
+
+    def __init__(self, companies):
+        self.tickers = [normalise_ticker(ticker) for ticker, _, _ in companies]
+        self.ciks = [int(cik) for _, cik, _ in companies]
+        self.titles = [title for _, _, title in companies]
+
+        self.by_ticker = {}
+        self.by_cik = {}
+        for position, (ticker, cik) in enumerate(zip(self.tickers, self.ciks)):
+            self.by_ticker.setdefault(ticker, position)
+            self.by_cik.setdefault(cik, []).append(position)
+
+        # Parallel sorted arrays: keys for bisect, and the company position of each key.
+        self.ticker_keys, self.ticker_positions = self._sorted_keys(
+            (ticker, position) for position, ticker in enumerate(self.tickers)
+        )
+        self.names = [normalise_name(title) for title in self.titles]
+        self.name_keys, self.name_positions = self._sorted_keys(
+            (name, position) for position, name in enumerate(self.names)
+        )
+        self.word_keys, self.word_positions = self._sorted_keys(
+            (word, position) for position, name in enumerate(self.names) for word in set(name.split())
+        )
+
+    @staticmethod
+    def _sorted_keys(pairs):
+        pairs = sorted(pairs)
+        return [key for key, _ in pairs], [position for _, position in pairs]
+
+    @classmethod
+    def from_json(cls, path=TICKERS_PATH):
+        """Build the index from a company_tickers.json file."""
+        with open(path, 'r', encoding='utf-8') as file:
+            data = json.load(file)
+        return cls([(entry['ticker'], entry['cik_str'], entry['title']) for entry in data.values()])
+
+    @classmethod
+    def load(cls, path=TICKERS_PATH, index_path=TICKER_INDEX_PATH):
+        """
+        Load the pickled index if it was built from the current version of the JSON file, and build (and
+        save) it otherwise.
+        """
+        stat = os.stat(path)
+        source = (INDEX_VERSION, stat.st_mtime_ns, stat.st_size)
+        try:
+            with open(index_path, 'rb') as file:
+                saved_source, index = pickle.load(file)
+            if saved_source == source:
+                return index
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError, ValueError, AttributeError):
+            pass
+
+        index = cls.from_json(path)
+        tmp_path = index_path + ".tmp"
+        with open(tmp_path, 'wb') as file:
+            pickle.dump((source, index), file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, index_path)
+        return index
+
+    def __len__(self):
+        return len(self.tickers)
+
+    def company(self, position):
+        return {"ticker": self.tickers[position], "cik": self.ciks[position], "title": self.titles[position]}
+
+    def cik(self, ticker):
+        """Return the CIK of a ticker (case-insensitive), or None if it is unknown."""
+        position = self.by_ticker.get(normalise_ticker(ticker))
+        return None if position is None else self.ciks[position]
+
+    def tickers_for(self, cik):
+        """Return every ticker listed under a CIK, e.g. the share classes of one company."""
+        return [self.tickers[position] for position in self.by_cik.get(int(cik), [])]
+
+    def search(self, query, limit=10, fuzzy=True):
+        """
+        Find companies for a search box: exact ticker, then ticker prefix, company-name prefix and
+        name-word prefix matches, and fuzzy matches on the name only if nothing matched by prefix. Within
+        each group, companies come in the order of company_tickers.json, which lists the largest first.
+
+        Returns:
+            list: Up to ``limit`` company dicts with ``ticker``, ``cik`` and ``title``, best first.
+        """
+        ticker, name = normalise_ticker(query), normalise_name(query)
+        if not ticker:
+            return []
+        found = []
+        seen = set()
+
+        def add(positions):
+            for position in positions:
+                if position not in seen and len(found) < limit:
+                    seen.add(position)
+                    found.append(position)
+
+        if ticker in self.by_ticker:
+            add([self.by_ticker[ticker]])
+        start, end = _prefix_range(self.ticker_keys, ticker)
+        add(sorted(self.ticker_positions[start:end]))
+        if name:
+            start, end = _prefix_range(self.name_keys, name)
+            add(sorted(self.name_positions[start:end]))
+            words = name.split()
+            matches = None
+            for word in words:
+                start, end = _prefix_range(self.word_keys, word)
+                positions = set(self.word_positions[start:end])
+                matches = positions if matches is None else matches & positions
+            add(sorted(matches))
+            if fuzzy and not found:
+                add(self._fuzzy(name, limit))
+        return [self.company(position) for position in found]
+
+    def _fuzzy(self, name, limit):
+        try:
+            from rapidfuzz import fuzz, process
+        except ImportError:
+            # Without rapidfuzz, only compare names sharing the query's first letter: typos rarely hit
+            # it, and it keeps difflib to a small slice of the names.
+            start, end = _prefix_range(self.name_keys, name[0])
+            matches = difflib.get_close_matches(name, self.name_keys[start:end], n=limit, cutoff=0.6)
+            return [self.name_positions[bisect_left(self.name_keys, match)] for match in matches]
+        return [position for _, _, position in process.extract(name, self.names, scorer=fuzz.WRatio, limit=limit,
+                                                              score_cutoff=60)]
+
+
+def get_index():
+    """Return the shared ticker index, loading it on first use."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = TickerIndex.load()
+    return _index
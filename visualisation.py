@@ -1,16 +1,51 @@
+import io
 import os
+import re
 import json
-import spacy
-from client import important_words, text_generation
-from wordcloud import WordCloud
-import matplotlib.pyplot as plt
+import threading
+from collections import Counter
+from client import analyse
+from entity_cache import EntityCache
+from entity_series import SERIES_DIR, EntitySeries, filing_year, series_key
+from filing_store import file_sha256, read_data_manifest
+from instrumentation import stage
+from ranking import ENTITY_TOKEN_BUDGET, prepare_entities
 
-# Load spaCy model with specific components disabled for increased processing speed.
-nlp = spacy.load('en_core_web_sm', disable=['parser', 'lemmatizer'])
+SPACY_MODEL = 'en_core_web_sm'
+_nlp = None
+_nlp_lock = threading.Lock()
+
+ENTITY_LABELS = {'PERSON', 'EVENT', 'PRODUCT', 'LAW'}
+# Documents are fed to spaCy in paragraph-bounded chunks of at most this many characters, which keeps
+# peak memory flat and stays far below nlp.max_length however long a filing is.
+CHUNK_CHARS = 50000
+N_PROCESS = os.cpu_count() or 1
+# Every worker process loads its own copy of the model, so one is only started per this many chunks.
+MIN_CHUNKS_PER_PROCESS = 8
+PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+
+def get_nlp():
+    """
+    Return the shared spaCy pipeline, loading it on first use.
+
+    spaCy and the model are only imported when entities are first needed, so importing this module
+    stays cheap. The pipeline is loaded with every component except the named entity recogniser
+    disabled, and the lock ensures concurrent callers load it only once.
+    """
+    global _nlp
+    if _nlp is None:
+        with _nlp_lock:
+            if _nlp is None:
+                import spacy
+                _nlp = spacy.load(SPACY_MODEL, enable=['ner'])
+    return _nlp
 
 def get_all_paths(directory):
     """
-    Retrieve all file paths within a specified directory recursively.
+    Retrieve all filing paths within a specified directory.
+
+    If the directory holds a manifest written by the filing store, the paths are taken from it in year
+    order; otherwise the directory is walked recursively.
 
     Args:
         directory (str): The directory from which to fetch file paths.
@@ -18,6 +53,10 @@ def get_all_paths(directory):
     Returns:
         list: A list of all file paths within the directory.
     """
+    manifest = read_data_manifest(directory)
+    if manifest is not None:
+        return [entry["path"] for entry in manifest]
+
     file_paths = []  
     for root, dirs, files in os.walk(directory):
         for file in files:
@@ -46,57 +85,298 @@ def read_texts(file_paths):
             print(f"Error reading {file_path}: {e}")
     return texts
 
-def extract_entities(texts):
+def split_into_chunks(text, max_chars=CHUNK_CHARS):
+    """
+    Split a document into chunks of at most max_chars characters, breaking on paragraph boundaries.
+
+    Paragraphs longer than max_chars are cut at the last whitespace before the limit.
+
+    Args:
+        text (str): The document to split.
+        max_chars (int): The maximum chunk size in characters.
+
+    Yields:
+        str: Consecutive chunks of the document.
+    """
+    chunk, size = [], 0
+    for paragraph in PARAGRAPH_BREAK.split(text):
+        while len(paragraph) > max_chars:
+            cut = paragraph.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            if chunk:
+                yield "\n\n".join(chunk)
+                chunk, size = [], 0
+            yield paragraph[:cut]
+            paragraph = paragraph[cut:]
+        if size + len(paragraph) > max_chars and chunk:
+            yield "\n\n".join(chunk)
+            chunk, size = [], 0
+        chunk.append(paragraph)
+        size += len(paragraph) + 2
+    if chunk:
+        yield "\n\n".join(chunk)
+
+def process_count(total_chars, max_chars=CHUNK_CHARS, n_process=N_PROCESS):
+    """
+    Return how many processes are worth running NER on for this much text: at most n_process, at most one
+    per MIN_CHUNKS_PER_PROCESS chunks, and 1 (no worker processes) for a few filings.
+    """
+    chunks = -(-total_chars // max_chars)
+    return max(1, min(n_process, chunks // MIN_CHUNKS_PER_PROCESS))
+
+def extract_entities(texts, n_process=N_PROCESS, batch_size=4, max_chars=CHUNK_CHARS):
     """
     Extract and count named entities from a list of texts, focusing on persons, events, products, and laws.
 
+    Texts are streamed to spaCy in paragraph-bounded chunks and processed by n_process worker processes.
+
     Args:
-        texts (list): A list of strings, each being a text to process.
+        texts (iterable): Strings, each being a text to process; may be a generator.
+        n_process (int): Number of processes spaCy runs the pipeline on.
+        batch_size (int): Number of chunks sent to a process at a time.
+        max_chars (int): The maximum chunk size in characters.
 
     Returns:
-        dict: A dictionary of entities and their occurrence counts.
+        Counter: Entities and their occurrence counts.
     """
-    entities = {}
-    for doc in nlp.pipe(texts, batch_size=1000):
-        for ent in doc.ents:
-            if ent.label_ in ['PERSON', 'EVENT', 'PRODUCT', 'LAW']:
-                entities[ent.text] = entities.setdefault(ent.text, 0) + 1
+    entities = Counter()
+    for counts in extract_entities_by_text(texts, n_process, batch_size, max_chars):
+        entities.update(counts)
     return entities
 
-def get_vis(ticker):
+def extract_entities_by_text(texts, n_process=N_PROCESS, batch_size=4, max_chars=CHUNK_CHARS, on_progress=None):
+    """
+    Like extract_entities, but keep a separate count for each input text.
+
+    Args:
+        on_progress (callable): Called with the number of texts fully processed so far.
+
+    Returns:
+        list: One Counter per text, in input order.
+    """
+    counts = []
+
+    def chunks():
+        for index, text in enumerate(texts):
+            counts.append(Counter())
+            for chunk in split_into_chunks(text, max_chars):
+                yield chunk, index
+
+    current = 0
+    for doc, index in get_nlp().pipe(chunks(), as_tuples=True, batch_size=batch_size, n_process=n_process):
+        # Docs come back in input order, so reaching a new text means every earlier one is complete.
+        if on_progress is not None and index > current:
+            current = index
+            on_progress(current)
+        counts[index].update(ent.text for ent in doc.ents if ent.label_ in ENTITY_LABELS)
+    if on_progress is not None:
+        on_progress(len(counts))
+    return counts
+
+def model_key():
+    """
+    Identify everything that determines the entity counts of a text: the spaCy model and version, the
+    entity labels kept, and the chunk size.
+    """
+    meta = get_nlp().meta
+    return f"{meta['lang']}_{meta['name']}-{meta['version']}:{','.join(sorted(ENTITY_LABELS))}:{CHUNK_CHARS}"
+
+def get_filings(directory):
+    """
+    List the filings in a data folder with their content hashes.
+
+    Returns:
+        list: Dicts with at least ``path`` and ``sha256``, taken from the folder's manifest when it has one.
+    """
+    manifest = read_data_manifest(directory)
+    if manifest is not None:
+        return manifest
+    return [{"path": path, "sha256": file_sha256(path)} for path in sorted(get_all_paths(directory))]
+
+def count_entities(filings, cache=None, on_progress=None):
+    """
+    Get per-filing entity counts, running NER only on filings whose counts are not cached yet.
+
+    Args:
+        filings (list): Dicts with ``path`` and ``sha256`` keys, as returned by get_filings.
+        cache (EntityCache): The cache to consult and fill; defaults to the on-disk cache.
+        on_progress (callable): Called with ``(filings done, filings total)``, cached filings counting as done.
+
+    Returns:
+        list: One Counter per filing, in input order.
+    """
+    if cache is None:
+        cache = EntityCache()
+    model = model_key()
+    with stage("ner") as span:
+        counts = cache.get_many([filing["sha256"] for filing in filings], model)
+        missing = [filing for filing in filings if filing["sha256"] not in counts]
+        span.add(cache_hits=len(filings) - len(missing), cache_misses=len(missing))
+        print(f"Entity counts cached for {len(filings) - len(missing)}/{len(filings)} filings")
+        if on_progress is not None:
+            on_progress(len(filings) - len(missing), len(filings))
+
+        if missing:
+            unreadable = set()
+
+            def texts():
+                for index, filing in enumerate(missing):
+                    text = read_texts([filing["path"]])
+                    if not text:
+                        unreadable.add(index)
+                    else:
+                        span.add(bytes=len(text[0].encode("utf-8")), items=1)
+                    yield text[0] if text else ""
+
+            cached = len(filings) - len(missing)
+            report = None if on_progress is None else lambda done: on_progress(cached + done, len(filings))
+            # Re-running a ticker with one new filing stays in this process instead of forking a worker per CPU.
+            total_chars = sum(os.path.getsize(filing["path"]) for filing in missing if os.path.exists(filing["path"]))
+            fresh = extract_entities_by_text(texts(), n_process=process_count(total_chars), on_progress=report)
+            # Files that could not be read count as empty for this run but are never cached.
+            new_counts = {
+                filing["sha256"]: entities
+                for index, (filing, entities) in enumerate(zip(missing, fresh)) if index not in unreadable
+            }
+            cache.put_many(new_counts, model)
+            counts.update(new_counts)
+
+    return [Counter(counts.get(filing["sha256"], {})) for filing in filings]
+
+def keyword_frequencies(response, all_entities):
+    """
+    Weight the keywords returned by the LLM with the entity counts already extracted from the filings.
+
+    Args:
+        response (str): The JSON returned by important_words; a dict keyed by keyword or a list of keywords.
+        all_entities (dict): Merged entity counts of the filings.
+
+    Returns:
+        dict: Keyword frequencies; keywords the filings never mention get their numeric value from the
+        response if it has one, and 1 otherwise.
+    """
+    try:
+        keywords = json.loads(response)
+    except (TypeError, ValueError):
+        return {}
+    if isinstance(keywords, list):
+        keywords = {str(keyword): None for keyword in keywords}
+    elif not isinstance(keywords, dict) or "error" in keywords:
+        return {}
+
+    counts = {entity.casefold(): count for entity, count in all_entities.items()}
+    frequencies = {}
+    for keyword, value in keywords.items():
+        count = counts.get(keyword.casefold())
+        if count is None:
+            count = value if isinstance(value, (int, float)) and value > 0 else 1
+        frequencies[keyword] = count
+    return frequencies
+
+def render_word_cloud(frequencies, width=800, height=400):
+    """
+    Render a word cloud straight from word frequencies to PNG bytes, without a matplotlib figure.
+
+    Returns:
+        BytesIO: An in-memory buffer holding the PNG image, positioned at the start.
+    """
+    from wordcloud import WordCloud
+
+    with stage("render") as span:
+        wordcloud = WordCloud(width=width, height=height).generate_from_frequencies(frequencies)
+        buffer = io.BytesIO()
+        wordcloud.to_image().save(buffer, format="PNG")
+        span.add(bytes=buffer.tell(), items=len(frequencies))
+    buffer.seek(0)
+    return buffer
+
+def load_series(directory, cache=None, on_progress=None):
+    """
+    Get the year-by-entity counts of the filings in a data folder.
+
+    Each data folder keeps one series file in SERIES_DIR, overwritten when its filings or the NER model
+    change. A series saved for exactly these filings and model is loaded from it; otherwise it is built
+    from the per-filing counts (running NER only on filings the entity cache has not seen) and saved.
+
+    Args:
+        directory (str): The data folder.
+        cache (EntityCache): Passed on to count_entities.
+        on_progress (callable): Passed on to count_entities.
+
+    Returns:
+        EntitySeries: Entity counts per year.
+    """
+    with stage("series") as span:
+        filings = get_filings(directory)
+        span.add(items=len(filings))
+        key = series_key(filings, model_key())
+        name = os.path.basename(os.path.normpath(directory))
+        path = os.path.join(SERIES_DIR, f"{name}.npz")
+        if os.path.exists(path):
+            series = EntitySeries.load(path)
+            if series.key == key:
+                span.add(cache_hits=1)
+                if on_progress is not None:
+                    on_progress(len(filings), len(filings))
+                return series
+
+        span.add(cache_misses=1)
+        per_filing = count_entities(filings, cache, on_progress)
+        series = EntitySeries.from_counts([filing_year(filing) for filing in filings], per_filing, key)
+        series.save(path)
+        remove_stale_series(name)
+        return series
+
+def remove_stale_series(name):
+    """Delete the series files earlier versions saved per key, as ``{name}-{key[:16]}.npz``."""
+    stale = re.compile(re.escape(name) + r"-[0-9a-f]{16}\.npz")
+    for file_name in os.listdir(SERIES_DIR):
+        if stale.fullmatch(file_name):
+            try:
+                os.remove(os.path.join(SERIES_DIR, file_name))
+            except FileNotFoundError:
+                pass
+
+def entity_payload(per_filing, token_budget=ENTITY_TOKEN_BUDGET):
+    """Rank the entities locally and keep only as many as fit the token budget of the LLM request."""
+    payload, stats = prepare_entities(per_filing, token_budget=token_budget)
+    print(f"Entity payload: {stats['kept_entities']}/{stats['original_entities']} entities, "
+          f"{stats['payload_tokens']} tokens ({stats['saved_tokens']} saved)")
+    return payload
+
+def render_vis(response, all_entities):
+    """Render the word cloud of the LLM's keywords, falling back to all extracted entities if it gave too few."""
+    frequencies = keyword_frequencies(response, all_entities)
+    if len(frequencies) < 10:
+        frequencies = all_entities
+    return render_word_cloud(frequencies)
+
+def get_vis(ticker, token_budget=ENTITY_TOKEN_BUDGET, directory=None, start_year=None, end_year=None):
     """
     Generate a visualization of important words as a word cloud for texts related to a specific ticker.
 
     Args:
         ticker (str): The ticker symbol of the company for which to generate a word cloud.
+        token_budget (int): Maximum number of tokens of the entity payload sent to the LLM.
+        directory (str): The data folder holding the ticker's filings; defaults to ``data-{ticker}``.
+        start_year (int): Only use filings from this year on; all when None.
+        end_year (int): Only use filings up to this year; all when None.
 
     Returns:
-        str: The response text after generating the word cloud.
-    """
-    # Collect all paths for a given ticker and read the texts.
-    file_paths = get_all_paths(f"data-{ticker}")    
-    texts = read_texts(sorted(file_paths))
-    
-    # Extract relevant entities from the texts.
-    all_entities = extract_entities(texts)
+        tuple: The response text and the word cloud as a PNG in an in-memory buffer.
+    """
+    # Extract relevant entities from the texts, reusing cached counts for filings seen before, and
+    # slice them to the requested years.
+    series = load_series(directory or f"data-{ticker}")
+    if not series.years:
+        raise ValueError(f"no filings found for {ticker} in {directory or f'data-{ticker}'}")
+    all_entities = series.counts(start_year, end_year)
     print("Extraction Done")
-    
-    # Retrieve important words from the entities using an external service.
+
+    # Retrieve important words from the entities using an external service, then the text analysis of them.
     print("Getting words...")
-    response = important_words(all_entities)
-    dict = json.loads(response)
+    response, text_response = analyse(entity_payload(series.per_year(start_year, end_year), token_budget))
     print("Finishing")
-    
-    # Generate additional text responses if necessary.
-    text_response = text_generation(response=response)
 
     # Generate a word cloud. If too few important words, fallback to all extracted entities.
-    if len(dict.keys()) < 10:
-        dict = all_entities
-    wordcloud = WordCloud(width=800, height=400).generate(' '.join(dict.keys()))
-    plt.figure(figsize=(10, 5))
-    plt.imshow(wordcloud, interpolation='bilinear')
-    plt.axis('off')
-    plt.savefig('vis.png')
-
-    return text_response
\ No newline at end of file
+    return text_response, render_vis(response, all_entities)